@@ -1,33 +1,1333 @@
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Request, Response, g, has_request_context, request, jsonify, render_template_string, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from datetime import datetime
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+import bisect
+import gzip
+import hashlib
+import io
+import itertools
 import json
+import math
 import os
+import queue
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+startup_began = time.perf_counter()
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pymongo
+    from pymongo import DeleteMany, DeleteOne, InsertOne
+except ImportError:
+    pymongo = None
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
 
 app = Flask(__name__)
 CORS(app)
 
+# Startup phases (import, storage_open, index_build, cache_warm), each timed
+# and reported by /health and in the log. With BREATH_LAZY_WARMUP=1 the index
+# build and cache warm run in the background after import; until the indexes
+# are ready, requests other than /health and /ready wait up to
+# BREATH_WARMUP_WAIT seconds and then get a 503.
+LAZY_WARMUP = os.environ.get('BREATH_LAZY_WARMUP', '0') == '1'
+WARMUP_WAIT = float(os.environ.get('BREATH_WARMUP_WAIT', '30'))
+WARMUP_PATHS = os.environ.get('BREATH_WARMUP_PATHS', '/,/api/dashboard?limit=50,/api/stats,/api/trends').split(',')
+startup_state = {'mode': 'lazy' if LAZY_WARMUP else 'eager', 'phases': {}, 'ready': False,
+                 'ready_after_ms': None, 'error': None}
+indexes_ready = threading.Event()
+
+@contextmanager
+def startup_phase(name):
+    began = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_state['phases'][name] = round((time.perf_counter() - began) * 1000, 1)
+
+# Background threads. They start once the module has been imported, except
+# under a preforking server (BREATH_PREFORK=1): threads do not survive fork(),
+# so serve.py starts them in each worker after the fork instead.
+PREFORK = os.environ.get('BREATH_PREFORK', '0') == '1'
+background_threads = []
+
+def run_in_background(target, name):
+    background_threads.append((target, name))
+
+def start_background():
+    for target, name in background_threads:
+        threading.Thread(target=target, name=name, daemon=True).start()
+
+# Request tracing. A sampled request gets a root span with child spans for
+# body parsing, each storage mutation, persistence and serialization. Finished
+# traces are written by a background thread as Zipkin v2 JSON spans, one per
+# line, so the file can be replayed into a collector as-is.
+TRACE_FILE = os.environ.get('BREATH_TRACE_FILE', '')
+TRACE_SAMPLE_RATE = float(os.environ.get('BREATH_TRACE_SAMPLE', '1.0'))
+TRACE_SERVICE = 'breath-timer'
+
+trace_queue = queue.Queue(maxsize=1000)
+trace_stats = {'sampled': 0, 'exported': 0, 'dropped': 0}
+
+def new_span_id():
+    return os.urandom(8).hex()
+
+def current_trace():
+    return g.get('trace') if has_request_context() else None
+
+def count_records(data):
+    if isinstance(data, list):
+        return len(data)
+    if isinstance(data, dict):
+        return len(data['operations']) if isinstance(data.get('operations'), list) else 1
+    return 0
+
+def record_span(trace, name, start, duration, tags, parent=True):
+    record = {
+        'traceId': trace['id'],
+        'id': new_span_id() if parent else trace['root'],
+        'name': name,
+        'timestamp': int(start * 1e6),
+        'duration': max(int(duration * 1e6), 1),
+        'localEndpoint': {'serviceName': TRACE_SERVICE},
+        'tags': {k: str(v) for k, v in tags.items()}
+    }
+    if parent:
+        record['parentId'] = trace['root']
+    else:
+        record['kind'] = 'SERVER'
+    trace['spans'].append(record)
+
+@contextmanager
+def span(name, trace=None, **tags):
+    trace = trace or current_trace()
+    if trace is None:
+        yield tags
+        return
+    start = time.time()
+    began = time.perf_counter()
+    try:
+        yield tags
+    finally:
+        record_span(trace, name, start, time.perf_counter() - began, tags)
+
+class TracedRequest(Request):
+    json_parsed = False
+
+    def get_json(self, *args, **kwargs):
+        # Later calls are answered from Werkzeug's cache; only the parse is a span
+        if self.json_parsed:
+            return super().get_json(*args, **kwargs)
+        self.json_parsed = True
+        with span('request.get_json', bytes=self.content_length or 0) as tags:
+            data = super().get_json(*args, **kwargs)
+            tags['records'] = count_records(data)
+            return data
+
+class TracedJSONProvider(DefaultJSONProvider):
+    def response(self, *args, **kwargs):
+        with span('jsonify') as tags:
+            response = super().response(*args, **kwargs)
+            tags['bytes'] = response.content_length or 0
+            tags['records'] = count_records(args[0] if len(args) == 1 else kwargs)
+            return response
+
+app.request_class = TracedRequest
+app.json = TracedJSONProvider(app)
+
+@app.before_request
+def start_trace():
+    # Warm-up requests are the server's own, not traffic
+    if TRACE_FILE and not request.environ.get('breath.warm_up') and random.random() < TRACE_SAMPLE_RATE:
+        g.trace = {'id': os.urandom(16).hex(), 'root': new_span_id(), 'spans': [],
+                   'start': time.time(), 'began': time.perf_counter()}
+
+@app.after_request
+def tag_trace(response):
+    trace = current_trace()
+    if trace is not None:
+        trace['status'] = response.status_code
+        trace['bytes'] = response.content_length or 0
+    return response
+
+@app.teardown_request
+def export_trace(error):
+    trace = g.pop('trace', None)
+    if trace is None:
+        return
+    tags = {'http.method': request.method, 'http.path': request.path,
+            'http.status_code': trace.get('status', 500), 'bytes': trace.get('bytes', 0)}
+    if error is not None:
+        tags['error'] = str(error)
+    rule = request.url_rule.rule if request.url_rule else request.path
+    record_span(trace, f'{request.method} {rule}', trace['start'],
+                time.perf_counter() - trace['began'], tags, parent=False)
+    try:
+        trace_queue.put_nowait(trace['spans'])
+        trace_stats['sampled'] += 1
+    except queue.Full:
+        trace_stats['dropped'] += 1
+
+def trace_exporter():
+    with open(TRACE_FILE, 'a') as f:
+        while True:
+            spans = trace_queue.get()
+            f.write(''.join(json.dumps(s) + '\n' for s in spans))
+            f.flush()
+            trace_stats['exported'] += 1
+
+if TRACE_FILE:
+    run_in_background(trace_exporter, 'breath-tracer')
+
 # Data file path
 DATA_FILE = 'breath_data.json'
 
+# Optional document-store backend (BREATH_MONGO_URI) in place of the JSON
+# file. Each writer batch becomes one ordered bulk write per collection, and
+# timing reads and stats are answered by indexed queries and aggregation in
+# the database. 'mongomock://' runs against an in-process stand-in.
+MONGO_URI = os.environ.get('BREATH_MONGO_URI', '')
+MONGO_DB = os.environ.get('BREATH_MONGO_DB', 'breath')
+
+def connect_docstore():
+    if not MONGO_URI:
+        return None
+    if pymongo is None:
+        raise RuntimeError('BREATH_MONGO_URI requires pymongo')
+    if MONGO_URI.startswith('mongomock://'):
+        if mongomock is None:
+            raise RuntimeError('BREATH_MONGO_URI=mongomock:// requires mongomock')
+        db = mongomock.MongoClient()[MONGO_DB]
+    else:
+        db = pymongo.MongoClient(MONGO_URI)[MONGO_DB]
+    db.timings.create_index([('timestamp', -1)])
+    db.timings.create_index([('type', 1), ('timestamp', -1)])
+    db.sessions.create_index([('timestamp', -1)])
+    # The database drops dedup keys itself once they expire
+    db.idempotency.create_index('expires', expireAfterSeconds=0)
+    return db
+
+# Idempotency keys added (entry) or dropped (None) since the last bulk write,
+# and the meta fields as last written, so each batch sends only what changed
+idempotency_changes = {}
+docstore_meta = {}
+
+def note_idempotency(key, entry):
+    if docstore is not None:
+        idempotency_changes[key] = entry
+
+def load_docstore(data):
+    data['timings'] = list(docstore.timings.find().sort('timestamp', 1))
+    data['sessions'] = list(docstore.sessions.find().sort('timestamp', 1))
+    # In expiry order, which is the order idempotent() keeps them in
+    data['idempotency'] = {
+        doc['_id']: {'id': doc['id'], 'expires': doc['expires'].replace(tzinfo=timezone.utc).timestamp()}
+        for doc in docstore.idempotency.find().sort('expires', 1)
+    }
+    state = docstore.meta.find_one({'_id': 'state'}) or {}
+    data['profile'] = state.get('profile', {})
+    data['log_seq'] = state.get('log_seq', 0)
+    data['id_seq'] = state.get('id_seq', {})
+    idempotency_changes.clear()
+    docstore_meta.clear()
+    docstore_meta.update({k: json.loads(json.dumps(data[k])) for k in ('profile', 'log_seq', 'id_seq')})
+    return data
+
+def write_docstore(entries):
+    timing_ops = []
+    session_ops = []
+    idempotency_ops = []
+    for entry in entries:
+        op = entry['op']
+        if op == 'timing':
+            timing_ops.append(InsertOne(dict(entry['record'])))
+        elif op == 'remove_timing':
+            timing_ops.append(DeleteOne({'_id': entry['id']}))
+        elif op == 'delete_timings':
+            timing_ops.append(DeleteMany({'_id': {'$in': entry['ids']}}))
+        elif op == 'delete_sessions':
+            session_ops.append(DeleteMany({'_id': {'$in': entry['ids']}}))
+        elif op == 'session':
+            session_ops.append(InsertOne(dict(entry['record'])))
+        elif op == 'clear':
+            # Anything earlier in the batch is wiped by the clear anyway
+            timing_ops = [DeleteMany({})]
+            session_ops = [DeleteMany({})]
+            idempotency_ops = [DeleteMany({})]
+    for key, entry in idempotency_changes.items():
+        # Delete then insert instead of an upserting replace, which the
+        # mongomock stand-in's bulk API cannot take
+        idempotency_ops.append(DeleteOne({'_id': key}))
+        if entry is not None:
+            idempotency_ops.append(InsertOne({
+                '_id': key, 'id': entry['id'], 'expires': datetime.fromtimestamp(entry['expires'], timezone.utc)
+            }))
+    idempotency_changes.clear()
+    if timing_ops:
+        docstore.timings.bulk_write(timing_ops, ordered=True)
+    if session_ops:
+        docstore.sessions.bulk_write(session_ops, ordered=True)
+    if idempotency_ops:
+        docstore.idempotency.bulk_write(idempotency_ops, ordered=True)
+    fields = {'profile': storage['profile'], 'log_seq': storage.get('log_seq', 0), 'id_seq': storage.get('id_seq', {})}
+    changed = {k: v for k, v in fields.items() if docstore_meta.get(k) != v}
+    if changed:
+        docstore.meta.update_one({'_id': 'state'}, {'$set': changed}, upsert=True)
+        docstore_meta.update(json.loads(json.dumps(changed)))
+    return len(timing_ops) + len(session_ops) + len(idempotency_ops)
+
+def docstore_timings(timing_type=None, start=None, end=None, limit=None, before=None):
+    if limit == 0:
+        return []
+    query = {}
+    if timing_type:
+        query['type'] = timing_type
+    bounds = {}
+    if start:
+        bounds['$gte'] = start
+    if end:
+        bounds['$lte'] = end + '\uffff'
+    if before:
+        bounds['$lt'] = before
+    if bounds:
+        query['timestamp'] = bounds
+    cursor = docstore.timings.find(query).sort('timestamp', -1)
+    if limit is not None:
+        cursor = cursor.limit(limit)
+    return list(cursor)
+
+def docstore_stats():
+    totals = {row['_id']: (row['count'], row['total']) for row in docstore.timings.aggregate([
+        {'$group': {'_id': '$type', 'count': {'$sum': 1}, 'total': {'$sum': '$duration'}}}
+    ])}
+
+    def avg(name):
+        count, total = totals.get(name, (0, 0.0))
+        return total / count if count else 0
+
+    return {
+        'total_timings': sum(count for count, _ in totals.values()),
+        'total_sessions': docstore.sessions.count_documents({}),
+        'avg_inhale': avg('Inhalation'),
+        'avg_hold': avg('Breath-Hold'),
+        'avg_exhale': avg('Exhalation')
+    }
+
 def load_data():
+    data = {'timings': [], 'sessions': [], 'profile': {}, 'idempotency': {}}
+    if docstore is not None:
+        return load_docstore(data)
     if os.path.exists(DATA_FILE):
         try:
             with open(DATA_FILE, 'r') as f:
-                return json.load(f)
+                data.update(json.load(f))
         except:
             pass
-    return {'timings': [], 'sessions': [], 'profile': {}}
+    return data
 
 def save_data(data):
     try:
-        with open(DATA_FILE, 'w') as f:
+        # Replace atomically so other processes never read a half-written file
+        tmp = DATA_FILE + '.tmp'
+        with open(tmp, 'w') as f:
             json.dump(data, f, indent=2)
+            size = f.tell()
+        os.replace(tmp, DATA_FILE)
+        return size
     except Exception as e:
         print(f"Error saving data: {e}")
 
+# Cold tier: timings older than the retention window are moved into immutable
+# gzip segments, one per day, described by a manifest of per-segment summaries
+# so stats and range queries only open the segments they actually need.
+ARCHIVE_DIR = os.environ.get('BREATH_ARCHIVE_DIR', 'archive')
+MANIFEST_FILE = os.path.join(ARCHIVE_DIR, 'manifest.json')
+RETENTION_DAYS = int(os.environ.get('BREATH_RETENTION_DAYS', '0'))
+ARCHIVE_INTERVAL = int(os.environ.get('BREATH_ARCHIVE_INTERVAL', '3600'))
+SEGMENT_CACHE_SIZE = 8
+
+def load_manifest():
+    if os.path.exists(MANIFEST_FILE):
+        try:
+            with open(MANIFEST_FILE, 'r') as f:
+                return json.load(f)
+        except:
+            pass
+    return {}
+
+segment_cache = OrderedDict()
+segment_lock = threading.Lock()
+
+def drop_archived(data):
+    # A crash between writing a segment and saving the hot file leaves copies in both
+    data['timings'] = [t for t in data['timings'] if t['timestamp'][:10] not in archive_manifest]
+    return data
+
 # Load initial data
-storage = load_data()
+with startup_phase('storage_open'):
+    docstore = connect_docstore()
+    storage = load_data()
+    archive_manifest = load_manifest()
+    drop_archived(storage)
+
+TIMING_TYPES = ['Inhalation', 'Breath-Hold', 'Exhalation']
+
+# Secondary indexes over timings, keyed by type ('*' covers all types).
+# Each entry holds parallel lists of timestamps and records in timestamp order.
+timing_index = {}
+# Running (count, duration sum) per type for the hot timings
+timing_totals = {}
+
+# Last issued numeric _id per collection. It is saved with the data, so
+# neither deletes, restarts nor clears ever cause an id to be reused.
+def next_id(kind):
+    issued = storage.setdefault('id_seq', {})
+    if kind not in issued:
+        # Files written before the counter was saved: start after the largest id
+        ids = [int(r['_id']) for r in storage[kind] if str(r.get('_id', '')).isdigit()]
+        if kind == 'timings':
+            ids += [summary['max_id'] for summary in archive_manifest.values()]
+        issued[kind] = max(ids) if ids else -1
+    issued[kind] += 1
+    return str(issued[kind])
+
+def index_timing(timing):
+    for name in ('*', timing['type']):
+        keys, records = timing_index.setdefault(name, ([], []))
+        i = bisect.bisect_right(keys, timing['timestamp'])
+        keys.insert(i, timing['timestamp'])
+        records.insert(i, timing)
+    count, total = timing_totals.get(timing['type'], (0, 0.0))
+    timing_totals[timing['type']] = (count + 1, total + float(timing['duration']))
+
+def unindex_timing(timing):
+    for name in ('*', timing['type']):
+        keys, records = timing_index.get(name, ([], []))
+        i = bisect.bisect_left(keys, timing['timestamp'])
+        while i < len(keys) and keys[i] == timing['timestamp']:
+            if records[i] is timing:
+                del keys[i]
+                del records[i]
+                break
+            i += 1
+    count, total = timing_totals.get(timing['type'], (1, 0.0))
+    timing_totals[timing['type']] = (count - 1, total - float(timing['duration']) if count > 1 else 0.0)
+
+def build_timing_index():
+    # Built aside and swapped in, so concurrent readers never see a partial index
+    global timing_index, timing_totals
+    index = {}
+    totals = {}
+    for timing in sorted(storage['timings'], key=lambda t: t['timestamp']):
+        if timing.get('deleted'):
+            continue
+        for name in ('*', timing['type']):
+            keys, records = index.setdefault(name, ([], []))
+            keys.append(timing['timestamp'])
+            records.append(timing)
+        count, total = totals.get(timing['type'], (0, 0.0))
+        totals[timing['type']] = (count + 1, total + float(timing['duration']))
+    timing_index = index
+    timing_totals = totals
+
+def segment_path(day):
+    return os.path.join(ARCHIVE_DIR, f'timings-{day}.json.gz')
+
+def read_segment(day):
+    with segment_lock:
+        if day in segment_cache:
+            segment_cache.move_to_end(day)
+            return segment_cache[day]
+    with gzip.open(segment_path(day), 'rt') as f:
+        records = json.load(f)
+    with segment_lock:
+        segment_cache[day] = records
+        while len(segment_cache) > SEGMENT_CACHE_SIZE:
+            segment_cache.popitem(last=False)
+    return records
+
+def write_segment(day, records):
+    with segment_lock:
+        segment_cache.pop(day, None)
+    if not records:
+        os.remove(segment_path(day))
+        archive_manifest.pop(day, None)
+        return
+    records = sorted(records, key=lambda t: t['timestamp'])
+    tmp = segment_path(day) + '.tmp'
+    with gzip.open(tmp, 'wt') as f:
+        json.dump(records, f)
+    os.replace(tmp, segment_path(day))
+    ids = [int(t['_id']) for t in records if str(t['_id']).isdigit()]
+    types = {}
+    for t in records:
+        count, total = types.get(t['type'], (0, 0.0))
+        types[t['type']] = (count + 1, total + float(t['duration']))
+    archive_manifest[day] = {
+        'count': len(records),
+        'min_id': min(ids) if ids else -1,
+        'max_id': max(ids) if ids else -1,
+        'types': types
+    }
+
+def save_manifest():
+    tmp = MANIFEST_FILE + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(archive_manifest, f, indent=2)
+    os.replace(tmp, MANIFEST_FILE)
+
+def archived_count():
+    return sum(summary['count'] for summary in archive_manifest.values())
+
+def archive_old_timings():
+    # A document store keeps the full history itself
+    if RETENTION_DAYS <= 0 or docstore is not None:
+        return 0
+    # Only whole days are archived, so every segment is complete once written
+    cutoff = (datetime.now() - timedelta(days=RETENTION_DAYS)).strftime('%Y-%m-%d')
+    keys, records = timing_index.get('*', ([], []))
+    old = records[:bisect.bisect_left(keys, cutoff)]
+    if not old:
+        return 0
+    by_day = {}
+    for timing in old:
+        by_day.setdefault(timing['timestamp'][:10], []).append(timing)
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    for day, day_records in by_day.items():
+        if day in archive_manifest:
+            day_records = read_segment(day) + day_records
+        write_segment(day, day_records)
+    save_manifest()
+    storage['timings'] = [t for t in storage['timings'] if t['timestamp'] >= cutoff or t.get('deleted')]
+    build_timing_index()
+    log_mutation('archive')
+    return len(old)
+
+def remove_archived_timing(timing_id):
+    if not timing_id.isdigit():
+        return 0
+    removed = 0
+    for day, summary in list(archive_manifest.items()):
+        if not summary['min_id'] <= int(timing_id) <= summary['max_id']:
+            continue
+        day_records = read_segment(day)
+        kept = [t for t in day_records if t['_id'] != timing_id]
+        if len(kept) != len(day_records):
+            write_segment(day, kept)
+            removed += len(day_records) - len(kept)
+    if removed:
+        save_manifest()
+    return removed
+
+def clear_archive():
+    for day in list(archive_manifest):
+        os.remove(segment_path(day))
+    archive_manifest.clear()
+    with segment_lock:
+        segment_cache.clear()
+    if os.path.exists(MANIFEST_FILE):
+        os.remove(MANIFEST_FILE)
+
+def query_timings(timing_type=None, start=None, end=None, limit=None, before=None):
+    keys, records = timing_index.get(timing_type or '*', ([], []))
+    lo = bisect.bisect_left(keys, start) if start else 0
+    # 'to' is inclusive of every timestamp it prefixes, so a bare date covers the whole day
+    hi = bisect.bisect_right(keys, end + '\uffff') if end else len(keys)
+    # 'before' is an exclusive cursor for paging backwards through history
+    if before:
+        hi = min(hi, bisect.bisect_left(keys, before))
+    if limit is not None:
+        lo = max(lo, hi - limit)
+    result = records[lo:hi][::-1]
+
+    # Archived days are all older than the hot window; walk them newest first
+    for day in sorted(archive_manifest, reverse=True):
+        if limit is not None and len(result) >= limit:
+            break
+        if start and day < start[:10]:
+            break
+        if end and day[:len(end)] > end:
+            continue
+        if before and day > before[:10]:
+            continue
+        if timing_type and timing_type not in archive_manifest[day]['types']:
+            continue
+        matches = [t for t in read_segment(day)
+                   if (not timing_type or t['type'] == timing_type)
+                   and (not start or t['timestamp'] >= start)
+                   and (not end or t['timestamp'] <= end + '\uffff')
+                   and (not before or t['timestamp'] < before)]
+        matches.reverse()
+        if limit is not None:
+            matches = matches[:limit - len(result)]
+        result.extend(matches)
+    return result
+
+# Cache of serialized GET responses, keyed by endpoint and query string.
+# Each entry remembers which collections it was built from so writes only
+# evict what they touch.
+RESPONSE_CACHE_SIZE = int(os.environ.get('BREATH_CACHE_SIZE', '256'))
+response_cache = OrderedDict()
+cache_lock = threading.Lock()
+cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+data_versions = {'timings': 0, 'sessions': 0, 'profile': 0}
+
+def mark_changed(*kinds):
+    with cache_lock:
+        for kind in kinds:
+            data_versions[kind] += 1
+        stale = [k for k, entry in response_cache.items() if entry[1] & set(kinds)]
+        for key in stale:
+            del response_cache[key]
+        cache_stats['invalidations'] += len(stale)
+
+# Representations offered by the read endpoints. The columnar form sends each
+# field name once with a value array per field instead of repeating keys per record.
+COMPRESS_MIN_SIZE = int(os.environ.get('BREATH_COMPRESS_MIN_SIZE', '1024'))
+
+def to_columns(data):
+    if not isinstance(data, list):
+        return data
+    fields = sorted({k for record in data for k in record})
+    return {
+        'count': len(data),
+        'fields': fields,
+        'columns': [[record.get(f) for record in data] for f in fields]
+    }
+
+RESPONSE_ENCODERS = {
+    'application/json': lambda data: jsonify(data).get_data(),
+    'application/x-columnar+json': lambda data: jsonify(to_columns(data)).get_data()
+}
+if msgpack is not None:
+    RESPONSE_ENCODERS['application/msgpack'] = lambda data: msgpack.packb(data, use_bin_type=True)
+
+RESPONSE_COMPRESSORS = {'gzip': lambda body: gzip.compress(body, compresslevel=6, mtime=0)}
+if brotli is not None:
+    RESPONSE_COMPRESSORS['br'] = lambda body: brotli.compress(body, quality=5)
+
+def negotiate():
+    mimetype = request.accept_mimetypes.best_match(list(RESPONSE_ENCODERS), default='application/json')
+    coding = request.accept_encodings.best_match(['br', 'gzip', 'identity'], default='identity')
+    if coding not in RESPONSE_COMPRESSORS:
+        coding = 'identity'
+    return mimetype, coding
+
+def encode_response(data, mimetype, coding):
+    with span('serialize', mimetype=mimetype, records=count_records(data)) as tags:
+        body = RESPONSE_ENCODERS[mimetype](data)
+        tags['bytes'] = len(body)
+    etag = hashlib.sha1(mimetype.encode() + body).hexdigest()[:20]
+    if coding != 'identity' and len(body) >= COMPRESS_MIN_SIZE:
+        with span('compress', coding=coding) as tags:
+            body = RESPONSE_COMPRESSORS[coding](body)
+            tags['bytes'] = len(body)
+        return body, coding, etag
+    return body, 'identity', etag
+
+def cached_response(name, depends, build):
+    mimetype, coding = negotiate()
+    key = (name, tuple(sorted(request.args.items(multi=True))), mimetype, coding)
+    with cache_lock:
+        entry = response_cache.get(key)
+        if entry is not None:
+            response_cache.move_to_end(key)
+            cache_stats['hits'] += 1
+        else:
+            cache_stats['misses'] += 1
+            versions = tuple(data_versions[k] for k in depends)
+    if entry is not None:
+        body, encoding, etag = entry[0], entry[2], entry[3]
+        status = 'HIT'
+    else:
+        body, encoding, etag = encode_response(build(), mimetype, coding)
+        status = 'MISS'
+        with cache_lock:
+            # Skip the store if a write landed while we were building
+            if versions == tuple(data_versions[k] for k in depends):
+                response_cache[key] = (body, set(depends), encoding, etag)
+                while len(response_cache) > RESPONSE_CACHE_SIZE:
+                    response_cache.popitem(last=False)
+                    cache_stats['evictions'] += 1
+    response = app.response_class(body, mimetype=mimetype)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept, Accept-Encoding'
+    response.headers['X-Cache'] = status
+    # Clients may keep the body but must revalidate; unchanged data costs a 304
+    response.headers['Cache-Control'] = 'no-cache'
+    response.set_etag(etag, weak=True)
+    return response.make_conditional(request)
+
+# Shared store mode for running several worker processes over one data file.
+# Writers serialize on an OS file lock and reload first if another process
+# has replaced the file; readers notice a changed file signature and reload,
+# which also invalidates this process's response cache.
+SHARED_STORE = os.environ.get('BREATH_SHARED_STORE', '') == '1'
+if SHARED_STORE and docstore is not None:
+    # Workers notice each other's writes through the data file, which a
+    # document store never writes; each would keep its own state and ids
+    raise RuntimeError('BREATH_SHARED_STORE does not work with BREATH_MONGO_URI; run a single worker')
+LOCK_FILE = DATA_FILE + '.lock'
+storage_lock = threading.RLock()
+store_state = {'signature': None, 'reloads': 0}
+
+def file_signature():
+    try:
+        st = os.stat(DATA_FILE)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def refresh_storage(force=False):
+    global archive_manifest
+    signature = file_signature()
+    if signature == store_state['signature'] and not force:
+        return False
+    archive_manifest = load_manifest()
+    issued = dict(storage.get('id_seq', {}))
+    storage.update(drop_archived(load_data()))
+    # Never go below what this process has already handed out
+    loaded = storage.get('id_seq', {})
+    storage['id_seq'] = {kind: max(issued.get(kind, -1), loaded.get(kind, -1)) for kind in set(issued) | set(loaded)}
+    with segment_lock:
+        segment_cache.clear()
+    build_timing_index()
+    count_tombstones()
+    build_trends()
+    reset_change_feed()
+    store_state['signature'] = signature
+    store_state['reloads'] += 1
+    mark_changed('timings', 'sessions', 'profile')
+    return True
+
+@contextmanager
+def locked_store():
+    with storage_lock:
+        if not SHARED_STORE:
+            yield
+            return
+        with open(LOCK_FILE, 'a+') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            else:
+                lock.seek(0)
+                msvcrt.locking(lock.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                refresh_storage()
+                yield
+                store_state['signature'] = file_signature()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+                else:
+                    lock.seek(0)
+                    msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+
+store_state['signature'] = file_signature()
+
+# Mutation log. The writer stamps each applied change with the next sequence
+# number, saves the data file (which records the last sequence it contains)
+# and keeps the changes in a bounded in-memory feed for /api/changes. With
+# BREATH_MUTATION_LOG set they are also appended as JSON lines, so a replica
+# can start from the data file and tail the log from there.
+MUTATION_LOG = os.environ.get('BREATH_MUTATION_LOG', '')
+MUTATION_LOG_MAX_BYTES = int(os.environ.get('BREATH_MUTATION_LOG_MAX_BYTES', str(16 * 1024 * 1024)))
+REPLICA = os.environ.get('BREATH_REPLICA', '0') == '1'
+CHANGE_FEED_SIZE = int(os.environ.get('BREATH_CHANGE_FEED_SIZE', '1000'))
+
+mutation_buffer = []
+change_feed = deque(maxlen=CHANGE_FEED_SIZE)
+# Every change after 'floor' is still in the feed; older cursors must resync
+feed_state = {'floor': storage.get('log_seq', 0)}
+
+def log_mutation(op, **fields):
+    if not REPLICA:
+        mutation_buffer.append(dict(fields, op=op))
+
+def remember_changes(entries):
+    for entry in entries:
+        if len(change_feed) == change_feed.maxlen:
+            feed_state['floor'] = change_feed[0]['seq']
+        change_feed.append(entry)
+
+def reset_change_feed():
+    change_feed.clear()
+    feed_state['floor'] = storage.get('log_seq', 0)
+
+def take_mutations():
+    entries = mutation_buffer[:]
+    del mutation_buffer[:]
+    for entry in entries:
+        storage['log_seq'] = storage.get('log_seq', 0) + 1
+        entry['seq'] = storage['log_seq']
+        entry['ts'] = time.time()
+    return entries
+
+def persist():
+    # A batch that changed nothing (replays, failed jobs, drains) saves nothing
+    if not mutation_buffer:
+        return 0
+    entries = take_mutations()
+    size = save_data(storage) if docstore is None else write_docstore(entries)
+    remember_changes(entries)
+    append_mutation_log(entries)
+    return size
+
+def append_mutation_log(entries):
+    if not MUTATION_LOG:
+        return
+    try:
+        with open(MUTATION_LOG, 'a') as f:
+            f.write(''.join(json.dumps(entry) + '\n' for entry in entries))
+        # Rotated aside whole; a replica finishes the old file before reopening
+        if os.path.getsize(MUTATION_LOG) > MUTATION_LOG_MAX_BYTES:
+            os.replace(MUTATION_LOG, MUTATION_LOG + '.1')
+    except Exception as e:
+        print(f"Error writing mutation log: {e}")
+
+# Storage mutations. These only ever run on the writer thread below.
+def make_timing(data, when=None):
+    when = when or datetime.now()
+    return {
+        'timestamp': when.isoformat(),
+        'type': data['type'],
+        'duration': float(data['duration']),
+        'date': when.strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+def make_session(data, when=None):
+    when = when or datetime.now()
+    return {
+        'date': when.strftime('%Y-%m-%d'),
+        'inhale': float(data['inhale']),
+        'hold': float(data['hold']),
+        'exhale': float(data['exhale']),
+        'timestamp': when.isoformat()
+    }
+
+def make_profile(data, when=None):
+    when = when or datetime.now()
+    return {
+        'fullName': data.get('fullName', ''),
+        'age': data.get('age', ''),
+        'email': data.get('email', ''),
+        'phone': data.get('phone', ''),
+        'height': data.get('height', ''),
+        'weight': data.get('weight', ''),
+        'medical': data.get('medical', ''),
+        'notes': data.get('notes', ''),
+        'updated': when.isoformat()
+    }
+
+def insert_timing(timing):
+    timing['_id'] = next_id('timings')
+    day = timing['timestamp'][:10]
+    if day in archive_manifest:
+        # Backdated into a day that is already archived (e.g. a late offline sync)
+        write_segment(day, read_segment(day) + [timing])
+        save_manifest()
+    else:
+        storage['timings'].append(timing)
+        index_timing(timing)
+    log_mutation('timing', record=timing)
+    mark_changed('timings')
+    return timing['_id']
+
+def remove_timing(timing_id):
+    removed = [t for t in storage['timings'] if t['_id'] == timing_id and not t.get('deleted')]
+    storage['timings'] = [t for t in storage['timings'] if t['_id'] != timing_id or t.get('deleted')]
+    for timing in removed:
+        unindex_timing(timing)
+    count = len(removed) or remove_archived_timing(timing_id)
+    if count:
+        forget_idempotent('timings', [timing_id])
+        log_mutation('remove_timing', id=timing_id)
+    mark_changed('timings')
+    return count
+
+# Range deletes mark records as tombstones ('deleted') and drop them from the
+# indexes and running totals in one pass; the compactor later removes them
+# from the stored lists.
+COMPACT_INTERVAL = int(os.environ.get('BREATH_COMPACT_INTERVAL', '300'))
+
+tombstone_counts = {'timings': 0, 'sessions': 0}
+
+def count_tombstones():
+    for kind in tombstone_counts:
+        tombstone_counts[kind] = sum(1 for r in storage[kind] if r.get('deleted'))
+
+def in_range(record, start, end):
+    return ((not start or record['timestamp'] >= start)
+            and (not end or record['timestamp'] <= end + '\uffff'))
+
+def delete_timings(timing_type=None, start=None, end=None):
+    keys, records = timing_index.get(timing_type or '*', ([], []))
+    lo = bisect.bisect_left(keys, start) if start else 0
+    hi = bisect.bisect_right(keys, end + '\uffff') if end else len(keys)
+    victims = records[lo:hi]
+    for timing in victims:
+        timing['deleted'] = True
+        count, total = timing_totals[timing['type']]
+        timing_totals[timing['type']] = (count - 1, total - float(timing['duration']) if count > 1 else 0.0)
+    # Every index holds the range as one contiguous slice; drop its tombstones
+    for keys, records in timing_index.values():
+        lo = bisect.bisect_left(keys, start) if start else 0
+        hi = bisect.bisect_right(keys, end + '\uffff') if end else len(keys)
+        kept = [i for i in range(lo, hi) if not records[i].get('deleted')]
+        keys[lo:hi] = [keys[i] for i in kept]
+        records[lo:hi] = [records[i] for i in kept]
+    tombstone_counts['timings'] += len(victims)
+    ids = [t['_id'] for t in victims]
+
+    # Archived days are rewritten without the matching records
+    changed = False
+    for day in list(archive_manifest):
+        if (start and day < start[:10]) or (end and day[:len(end)] > end):
+            continue
+        kept, removed = [], []
+        for t in read_segment(day):
+            matched = in_range(t, start, end) and (not timing_type or t['type'] == timing_type)
+            (removed if matched else kept).append(t)
+        if removed:
+            ids += [t['_id'] for t in removed]
+            write_segment(day, kept)
+            changed = True
+    if changed:
+        save_manifest()
+    if ids:
+        forget_idempotent('timings', ids)
+        log_mutation('delete_timings', ids=ids)
+        mark_changed('timings')
+    return len(ids)
+
+def delete_sessions(start=None, end=None):
+    victims = [s for s in storage['sessions'] if not s.get('deleted') and in_range(s, start, end)]
+    for session in victims:
+        session['deleted'] = True
+    tombstone_counts['sessions'] += len(victims)
+    if victims:
+        # EWMA state cannot be unwound, so the trends are replayed without them
+        build_trends()
+        forget_idempotent('sessions', [s['_id'] for s in victims])
+        log_mutation('delete_sessions', ids=[s['_id'] for s in victims])
+        mark_changed('sessions')
+    return len(victims)
+
+def compact_storage():
+    for kind in tombstone_counts:
+        if tombstone_counts[kind]:
+            storage[kind] = [r for r in storage[kind] if not r.get('deleted')]
+            tombstone_counts[kind] = 0
+    log_mutation('compact')
+
+def compact_worker():
+    while True:
+        time.sleep(COMPACT_INTERVAL)
+        if any(tombstone_counts.values()):
+            submit_write(compact_storage)
+
+def insert_session(session):
+    session['_id'] = next_id('sessions')
+    storage['sessions'].append(session)
+    track_session(session)
+    log_mutation('session', record=session)
+    mark_changed('sessions')
+    return session['_id']
+
+def analyse_session(session):
+    # Same rule as the page: distance of the h:e ratios from the ideal 4:2
+    if not session['inhale'] > 0:
+        return dict(session, ratio_h=None, ratio_e=None, deviation=None, category='Needs Attention')
+    h = session['hold'] / session['inhale']
+    e = session['exhale'] / session['inhale']
+    d = math.sqrt((h - 4) ** 2 + (e - 2) ** 2)
+    category = 'Healthy' if d <= 1 else 'Borderline' if d <= 2 else 'Needs Attention'
+    return dict(session, ratio_h=h, ratio_e=e, deviation=d, category=category)
+
+# Trend tracking over the session history. Each metric keeps an EWMA and a
+# fixed-size window with running sum and sum of squares, so a new session is
+# scored against the recent mean/std and folded in with O(1) work.
+TREND_WINDOW = int(os.environ.get('BREATH_TREND_WINDOW', '20'))
+TREND_ALPHA = float(os.environ.get('BREATH_TREND_ALPHA', '0.3'))
+TREND_Z_THRESHOLD = float(os.environ.get('BREATH_TREND_Z', '2.0'))
+TREND_MIN_SESSIONS = 5
+TREND_METRICS = ('deviation', 'hold_ratio', 'exhale_ratio')
+MAX_TREND_ALERTS = 100
+
+trends = {}
+
+def reset_trends():
+    trends.clear()
+    trends['count'] = 0
+    trends['alerts'] = deque(maxlen=MAX_TREND_ALERTS)
+    trends['metrics'] = {name: {'window': deque(), 'sum': 0.0, 'sumsq': 0.0,
+                                'ewma': None, 'last': None, 'z': None}
+                         for name in TREND_METRICS}
+
+def window_stats(metric):
+    n = len(metric['window'])
+    if not n:
+        return None, None
+    mean = metric['sum'] / n
+    return mean, math.sqrt(max(metric['sumsq'] / n - mean * mean, 0.0))
+
+def update_metric(metric, value):
+    # Score against the window as it was before this value joins it
+    mean, std = window_stats(metric)
+    z = None
+    if len(metric['window']) >= TREND_MIN_SESSIONS:
+        z = (value - mean) / std if std > 1e-9 else 0.0
+    metric['window'].append(value)
+    metric['sum'] += value
+    metric['sumsq'] += value * value
+    if len(metric['window']) > TREND_WINDOW:
+        old = metric['window'].popleft()
+        metric['sum'] -= old
+        metric['sumsq'] -= old * old
+    metric['ewma'] = value if metric['ewma'] is None else TREND_ALPHA * value + (1 - TREND_ALPHA) * metric['ewma']
+    metric['last'] = value
+    metric['z'] = z
+    return z
+
+def track_session(session):
+    analysed = analyse_session(session)
+    if analysed['deviation'] is None:
+        return
+    metrics = trends['metrics']
+    previous = metrics['deviation']['ewma']
+    values = {'deviation': analysed['deviation'], 'hold_ratio': analysed['ratio_h'],
+              'exhale_ratio': analysed['ratio_e']}
+    z = {name: update_metric(metrics[name], values[name]) for name in TREND_METRICS}
+    trends['count'] += 1
+
+    def alert(kind, metric):
+        trends['alerts'].append({
+            'kind': kind,
+            'metric': metric,
+            'session_id': session.get('_id'),
+            'timestamp': session['timestamp'],
+            'value': values[metric],
+            'z': z[metric]
+        })
+
+    # A higher D is worse; a falling hold ratio means hold capacity is dropping
+    if z['deviation'] is not None and z['deviation'] >= TREND_Z_THRESHOLD:
+        alert('deviation_spike', 'deviation')
+    if z['hold_ratio'] is not None and z['hold_ratio'] <= -TREND_Z_THRESHOLD:
+        alert('hold_ratio_drop', 'hold_ratio')
+    current = metrics['deviation']['ewma']
+    if previous is not None and previous <= 2 < current:
+        alert('trend_needs_attention', 'deviation')
+    elif previous is not None and previous <= 1 < current:
+        alert('trend_borderline', 'deviation')
+
+def build_trends():
+    reset_trends()
+    for session in sorted(storage['sessions'], key=lambda x: x['timestamp']):
+        if not session.get('deleted'):
+            track_session(session)
+
+def trend_report():
+    metrics = {}
+    for name, metric in trends['metrics'].items():
+        mean, std = window_stats(metric)
+        metrics[name] = {'last': metric['last'], 'ewma': metric['ewma'],
+                         'mean': mean, 'std': std, 'z': metric['z']}
+    deviation = metrics['deviation']
+    status = 'insufficient_data'
+    if trends['count'] >= TREND_MIN_SESSIONS:
+        # Recent sessions (EWMA) against the window they are drawn from
+        margin = 0.5 * (deviation['std'] or 0.0)
+        if deviation['ewma'] > deviation['mean'] + margin:
+            status = 'deteriorating'
+        elif deviation['ewma'] < deviation['mean'] - margin:
+            status = 'improving'
+        else:
+            status = 'stable'
+    return {
+        'sessions': trends['count'],
+        'window': TREND_WINDOW,
+        'status': status,
+        'metrics': metrics,
+        'alerts': list(trends['alerts'])[::-1]
+    }
+
+# Dedup index for retried creates: idempotency key -> id of the record it
+# created. Kept in storage so it is persisted and shared between workers;
+# entries expire after IDEMPOTENCY_TTL and the oldest go first past the cap.
+IDEMPOTENCY_TTL = int(os.environ.get('BREATH_IDEMPOTENCY_TTL', '86400'))
+IDEMPOTENCY_MAX_KEYS = int(os.environ.get('BREATH_IDEMPOTENCY_MAX_KEYS', '10000'))
+IDEMPOTENT_PATHS = ('/api/timings', '/api/sessions', '/api/sessions/assemble')
+
+def idempotency_key():
+    key = request.headers.get('Idempotency-Key')
+    if not key:
+        data = request.get_json(silent=True)
+        key = data.get('id') if isinstance(data, dict) else None
+    return f'{request.path}:{key}' if key else None
+
+def find_idempotent(key):
+    entry = storage['idempotency'].get(key)
+    if entry is None or entry['expires'] <= time.time():
+        return None
+    return entry['id']
+
+def forget_idempotent(kind, ids):
+    # A replayed key must not answer with a record that no longer exists
+    ids = set(ids)
+    index = storage['idempotency']
+    for key in [k for k, entry in index.items() if entry['id'] in ids and k.startswith(f'/api/{kind}')]:
+        del index[key]
+        note_idempotency(key, None)
+
+def idempotent(key, apply, *args):
+    if key is None:
+        return apply(*args)
+    existing = find_idempotent(key)
+    if existing is not None:
+        return existing
+    result = apply(*args)
+    if result is None:
+        return None
+    index = storage['idempotency']
+    now = time.time()
+    # Millisecond precision, which is all a document store date keeps
+    index[key] = {'id': result, 'expires': round(now + IDEMPOTENCY_TTL, 3)}
+    note_idempotency(key, index[key])
+    # Insertion order is expiry order, so expired keys are always at the front
+    while index:
+        oldest = next(iter(index))
+        if index[oldest]['expires'] > now and len(index) <= IDEMPOTENCY_MAX_KEYS:
+            break
+        del index[oldest]
+        note_idempotency(oldest, None)
+    return result
+
+def assemble_session(start=None, end=None, when=None):
+    # The tail of each per-type index is the latest timing of that phase
+    latest = {}
+    for name in TIMING_TYPES:
+        found = query_timings(name, start, end, 1)
+        if not found:
+            return None
+        latest[name] = found[0]
+    return insert_session(make_session({
+        'inhale': latest['Inhalation']['duration'],
+        'hold': latest['Breath-Hold']['duration'],
+        'exhale': latest['Exhalation']['duration']
+    }, when))
+
+# Batched writes from offline clients. Each operation carries its own
+# idempotency key and how long ago it was recorded, so replays are harmless
+# and records keep their original time regardless of the client's clock.
+BATCH_MAX_OPERATIONS = 500
+# Older claims are clamped; this also keeps absurd values from overflowing the date
+BATCH_MAX_AGE_MS = 30 * 24 * 3600 * 1000
+
+def prepare_operation(op):
+    kind = op.get('op')
+    data = op.get('data') or {}
+    age_ms = min(max(0.0, float(op.get('age_ms') or 0)), BATCH_MAX_AGE_MS)
+    when = datetime.now() - timedelta(milliseconds=age_ms)
+    if kind == 'timing':
+        if 'type' not in data or 'duration' not in data:
+            raise ValueError('Missing required fields')
+        return '/api/timings', insert_timing, (make_timing(data, when),)
+    if kind == 'session':
+        if not all(k in data for k in ['inhale', 'hold', 'exhale']):
+            raise ValueError('Missing required fields')
+        return '/api/sessions', insert_session, (make_session(data, when),)
+    if kind == 'assemble':
+        return '/api/sessions/assemble', assemble_session, (data.get('from'), data.get('to'), when)
+    if kind == 'profile':
+        return None, set_profile, (make_profile(data, when),)
+    raise ValueError(f'Unknown operation: {kind}')
+
+def apply_batch(prepared):
+    for result, path, apply, args in prepared:
+        key = f"{path}:{result['key']}" if path and result['key'] else None
+        try:
+            value = idempotent(key, apply, *args)
+        except Exception as e:
+            result.update(status=500, error=str(e))
+            continue
+        if value is None and result['op'] == 'assemble':
+            result.update(status=400, error='Need an Inhalation, Breath-Hold and Exhalation timing')
+        else:
+            result.update(status=200, id=value)
+
+def set_profile(profile):
+    storage['profile'] = profile
+    log_mutation('profile', record=profile)
+    mark_changed('profile')
+
+def clear_storage():
+    storage['timings'] = []
+    storage['sessions'] = []
+    storage['profile'] = {}
+    storage['idempotency'] = {}
+    # The 'clear' entry wipes the stored keys
+    idempotency_changes.clear()
+    build_timing_index()
+    count_tombstones()
+    reset_trends()
+    clear_archive()
+    log_mutation('clear')
+    mark_changed('timings', 'sessions', 'profile')
+
+# Admission control for writes. Mutations are queued to a single writer thread
+# that applies a whole batch and persists it once; when the queue is full or a
+# client exceeds its token bucket the request is rejected before any work is done.
+WRITE_QUEUE_DEPTH = int(os.environ.get('BREATH_WRITE_QUEUE_DEPTH', '64'))
+WRITE_RATE = float(os.environ.get('BREATH_WRITE_RATE', '10'))
+WRITE_BURST = float(os.environ.get('BREATH_WRITE_BURST', '20'))
+MAX_TRACKED_CLIENTS = 10000
+# POSTs that compute from their input or queue jobs and never reach the writer
+READ_ONLY_POSTS = ('/api/jobs', '/api/score')
+
+write_queue = queue.Queue(maxsize=WRITE_QUEUE_DEPTH)
+write_stats = {'accepted': 0, 'rejected': 0, 'throttled': 0, 'batches': 0}
+client_buckets = OrderedDict()
+bucket_lock = threading.Lock()
+
+def take_token(client):
+    now = time.monotonic()
+    with bucket_lock:
+        tokens, last = client_buckets.pop(client, (WRITE_BURST, now))
+        tokens = min(WRITE_BURST, tokens + (now - last) * WRITE_RATE)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        client_buckets[client] = (tokens, now)
+        while len(client_buckets) > MAX_TRACKED_CLIENTS:
+            client_buckets.popitem(last=False)
+    return allowed, math.ceil((1 - tokens) / WRITE_RATE) if not allowed else 0
+
+def submit_write(apply, *args):
+    job = {'apply': apply, 'args': args, 'done': threading.Event(), 'result': None, 'error': None,
+           'trace': current_trace()}
+    if has_request_context():
+        # A request that finds the queue full fails fast (see write_queue_busy)
+        write_queue.put_nowait(job)
+    else:
+        write_queue.put(job)
+    job['done'].wait()
+    if job['error'] is not None:
+        raise job['error']
+    return job['result']
+
+def write_worker():
+    while True:
+        batch = [write_queue.get()]
+        while True:
+            try:
+                batch.append(write_queue.get_nowait())
+            except queue.Empty:
+                break
+        with locked_store():
+            for job in batch:
+                # idempotent() wraps the real mutation; name the span after that
+                apply = job['args'][1] if job['apply'] is idempotent else job['apply']
+                with span('storage.' + apply.__name__, job['trace'],
+                          records=count_records(job['args'][-1]) if job['args'] else 0):
+                    try:
+                        job['result'] = job['apply'](*job['args'])
+                    except Exception as e:
+                        job['error'] = e
+            started = time.time()
+            began = time.perf_counter()
+            entries = []
+            if docstore is not None:
+                try:
+                    size = persist()
+                except Exception as e:
+                    # Nothing acknowledged may be missing from the database:
+                    # fail the whole batch and reload what actually got stored
+                    print(f"Error saving data: {e}")
+                    for job in batch:
+                        if job['error'] is None:
+                            job['error'] = e
+                    refresh_storage(force=True)
+                    size = 0
+            elif SHARED_STORE:
+                size = persist()
+            else:
+                # Only this thread changes stored records, so a private data
+                # file is encoded and written after the lock is released and
+                # readers are not held up behind the save. The feed is filled
+                # now, so /api/changes never reports a seq without its entries.
+                entries = take_mutations()
+                remember_changes(entries)
+                snapshot = dict(storage)
+                size = 0
+        if entries:
+            size = save_data(snapshot)
+            append_mutation_log(entries)
+        for job in batch:
+            if job['trace'] is not None:
+                record_span(job['trace'], 'save_data', started, time.perf_counter() - began,
+                            {'bytes': size, 'batch': len(batch)})
+        write_stats['batches'] += 1
+        for job in batch:
+            job['done'].set()
+
+def drain_writes():
+    # Batches are applied in order, so once this empty write has gone through
+    # everything queued ahead of it is persisted; it saves nothing itself
+    def drain():
+        return None
+    if not REPLICA:
+        submit_write(drain)
+
+def archive_timings():
+    count = archive_old_timings()
+    mark_changed('timings')
+    return count
+
+def archive_worker():
+    while True:
+        time.sleep(ARCHIVE_INTERVAL)
+        submit_write(archive_timings)
+
+# A replica never writes; its data arrives through the mutation log
+if not REPLICA:
+    run_in_background(write_worker, 'breath-writer')
+    if RETENTION_DAYS > 0:
+        run_in_background(archive_worker, 'breath-archiver')
+    run_in_background(compact_worker, 'breath-compactor')
 
 HTML_TEMPLATE = '''<!DOCTYPE html>
 <html lang="en">
@@ -784,40 +2084,67 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
 <script>
 const API_BASE = '/api';
 
-let timerInterval = null;
 let elapsedTime = 0;
+let startedAt = 0;
+let frameId = 0;
 let isRunning = false;
 let currentTimingType = '';
 
+// Elapsed time is derived from performance.now() timestamps rather than
+// counted ticks, so throttled or busy tabs never lose time. The display is
+// painted once per animation frame, and not at all while the tab is hidden.
+function currentElapsed() {
+  return isRunning ? elapsedTime + (performance.now() - startedAt) : elapsedTime;
+}
+
 function startTimer() {
   if (isRunning) return;
   isRunning = true;
-  timerInterval = setInterval(() => {
-    elapsedTime += 10;
-    updateDisplay();
-  }, 10);
+  startedAt = performance.now();
+  scheduleFrame();
+}
+
+function scheduleFrame() {
+  if (!frameId && isRunning && !document.hidden) frameId = requestAnimationFrame(paintFrame);
+}
+
+function paintFrame() {
+  frameId = 0;
+  updateDisplay();
+  scheduleFrame();
+}
+
+function stopFrames() {
+  cancelAnimationFrame(frameId);
+  frameId = 0;
 }
 
 function pauseTimer() {
+  if (!isRunning) return;
+  elapsedTime = currentElapsed();
   isRunning = false;
-  clearInterval(timerInterval);
+  stopFrames();
+  updateDisplay();
 }
 
 function resetTimer() {
   isRunning = false;
-  clearInterval(timerInterval);
+  stopFrames();
   elapsedTime = 0;
   updateDisplay();
 }
 
 function updateDisplay() {
-  const minutes = Math.floor(elapsedTime / 60000);
-  const seconds = Math.floor((elapsedTime % 60000) / 1000);
-  const ms = Math.floor((elapsedTime % 1000) / 10);
-  document.getElementById('display').textContent =
+  const elapsed = currentElapsed();
+  const minutes = Math.floor(elapsed / 60000);
+  const seconds = Math.floor((elapsed % 60000) / 1000);
+  const ms = Math.floor((elapsed % 1000) / 10);
+  const text =
     String(minutes).padStart(2,'0') + ':' +
     String(seconds).padStart(2,'0') + '.' +
     String(ms).padStart(2,'0');
+  const display = document.getElementById('display');
+  if (display.textContent !== text) display.textContent = text;
 }
 
 function updateTimingType() {
@@ -829,69 +2156,372 @@ function updateTimingType() {
   }
 }
 
-async function saveCurrentTiming() {
-  if (!currentTimingType) {
-    alert('Please select a timing type first.');
+// Offline-first writes: every change goes into a persistent IndexedDB outbox
+// first and is shown immediately, then synced to /api/batch in the
+// background, oldest first, with exponential backoff while the server is
+// unreachable or busy. Each change carries its own key so resends are harmless.
+const OUTBOX_DB = 'breath-outbox';
+const SYNC_BATCH_SIZE = 100;
+const SYNC_DELAY = 500;
+const MAX_BACKOFF = 60000;
+
+let outboxDb = null;
+let memoryOutbox = [];
+let memorySeq = 0;
+let syncTimer = null;
+let syncBackoff = 1000;
+let syncing = false;
+let syncAgain = false;
+
+function openOutbox() {
+  if (outboxDb) return Promise.resolve(outboxDb);
+  return new Promise(resolve => {
+    // Without IndexedDB (e.g. some private modes) the outbox lives in memory
+    if (!window.indexedDB) return resolve(null);
+    const request = indexedDB.open(OUTBOX_DB, 1);
+    request.onupgradeneeded = () => {
+      request.result.createObjectStore('ops', { keyPath: 'seq', autoIncrement: true });
+    };
+    request.onsuccess = () => {
+      outboxDb = request.result;
+      resolve(outboxDb);
+    };
+    request.onerror = () => resolve(null);
+  });
+}
+
+function outboxTransaction(mode, work) {
+  return openOutbox().then(db => new Promise((resolve, reject) => {
+    const tx = db.transaction('ops', mode);
+    const result = work(tx.objectStore('ops'));
+    tx.oncomplete = () => resolve(result && result.result);
+    tx.onerror = () => reject(tx.error);
+  }));
+}
+
+async function outboxAdd(op) {
+  if (!(await openOutbox())) {
+    memoryOutbox.push(Object.assign({ seq: ++memorySeq }, op));
     return;
   }
-  const seconds = (elapsedTime / 1000).toFixed(2);
-  
+  await outboxTransaction('readwrite', store => store.add(op));
+}
+
+async function outboxAll() {
+  if (!(await openOutbox())) return memoryOutbox.slice();
+  return outboxTransaction('readonly', store => store.getAll());
+}
+
+async function outboxDelete(seqs) {
+  if (!(await openOutbox())) {
+    memoryOutbox = memoryOutbox.filter(op => !seqs.includes(op.seq));
+    return;
+  }
+  await outboxTransaction('readwrite', store => seqs.forEach(seq => store.delete(seq)));
+}
+
+function newChangeKey() {
+  if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+  return Date.now() + '-' + Math.random().toString(36).slice(2);
+}
+
+async function queueChange(op, data) {
+  const change = { key: newChangeKey(), op: op, data: data, recorded: Date.now() };
+  await outboxAdd(change);
+  scheduleSync();
+  return change;
+}
+
+function scheduleSync(delay) {
+  clearTimeout(syncTimer);
+  syncTimer = setTimeout(syncOutbox, delay === undefined ? SYNC_DELAY : delay);
+}
+
+async function syncOutbox() {
+  if (syncing) {
+    syncAgain = true;
+    return;
+  }
+  syncing = true;
+  let retryAfter = 0;
   try {
-    const response = await fetch(`${API_BASE}/timings`, {
+    const ops = (await outboxAll()).slice(0, SYNC_BATCH_SIZE);
+    if (!ops.length) return;
+    const response = await fetch(`${API_BASE}/batch`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify({
-        type: currentTimingType,
-        duration: seconds
+        operations: ops.map(op => ({
+          op: op.op, key: op.key, data: op.data, age_ms: Date.now() - op.recorded
+        }))
       })
     });
-    
-    if (response.ok) {
-      alert('Saved: ' + currentTimingType + ' = ' + seconds + 's');
-      elapsedTime = 0;
-      updateDisplay();
-      loadPastData();
-      loadStats();
-    }
+    if (!response.ok) {
+      retryAfter = (parseInt(response.headers.get('Retry-After'), 10) || 0) * 1000;
+      throw new Error('Sync rejected with status ' + response.status);
+    }
+    const results = (await response.json()).results;
+    // Every change got a definitive answer; only server errors are kept for retry
+    const failed = new Set(results.filter(r => r.status >= 500).map(r => r.key));
+    await outboxDelete(ops.filter(op => !failed.has(op.key)).map(op => op.seq));
+    syncBackoff = 1000;
+    onChangesSynced(ops, results);
+    if (failed.size) throw new Error('Some changes failed to apply');
+    if (ops.length === SYNC_BATCH_SIZE) syncAgain = true;
   } catch (error) {
-    alert('Error saving timing. Check if backend is running.');
+    console.error('Sync failed, will retry:', error);
+    scheduleSync(Math.max(retryAfter, syncBackoff * (0.5 + Math.random())));
+    syncBackoff = Math.min(syncBackoff * 2, MAX_BACKOFF);
+    syncAgain = false;
+  } finally {
+    syncing = false;
+    if (syncAgain) {
+      syncAgain = false;
+      scheduleSync(0);
+    }
   }
 }
 
-async function loadPastData() {
+function onChangesSynced(ops, results) {
+  const synced = new Set(ops.map(op => op.key));
+  timingSource.pending = timingSource.pending.filter(r => !synced.has(r.key));
+  timingSource.views.forEach(renderWindow);
+  pullChanges();
+  if (results.some(r => r.op === 'assemble' && r.status === 400)) {
+    alert('Need at least one Inhalation, Breath-Hold, and Exhalation timing to save a session.');
+  }
+}
+
+function localDateTime(d) {
+  const pad = n => String(n).padStart(2, '0');
+  return `${d.getFullYear()}-${pad(d.getMonth() + 1)}-${pad(d.getDate())} ` +
+    `${pad(d.getHours())}:${pad(d.getMinutes())}:${pad(d.getSeconds())}`;
+}
+
+function pendingTimingRow(change) {
+  return {
+    _id: 'pending-' + change.key,
+    key: change.key,
+    pending: true,
+    type: change.data.type,
+    duration: change.data.duration,
+    date: localDateTime(new Date(change.recorded))
+  };
+}
+
+async function showPendingTimings() {
+  const ops = await outboxAll();
+  timingSource.pending = ops.filter(op => op.op === 'timing').map(pendingTimingRow).reverse();
+  timingSource.views.forEach(renderWindow);
+  scheduleSync(0);
+}
+
+async function saveCurrentTiming() {
+  if (!currentTimingType) {
+    alert('Please select a timing type first.');
+    return;
+  }
+  const seconds = (currentElapsed() / 1000).toFixed(2);
+  
   try {
-    const response = await fetch(`${API_BASE}/timings`);
-    const records = await response.json();
-    
-    const tbody1 = document.getElementById('past-data-table');
-    const tbody2 = document.getElementById('past-data-table-2');
+    const change = await queueChange('timing', { type: currentTimingType, duration: seconds });
+    timingSource.pending.unshift(pendingTimingRow(change));
+    timingSource.views.forEach(renderWindow);
+    alert('Saved: ' + currentTimingType + ' = ' + seconds + 's');
+    elapsedTime = 0;
+    if (isRunning) startedAt = performance.now();
+    updateDisplay();
+  } catch (error) {
+    alert('Error saving timing.');
+  }
+}
 
-    if (records.length === 0) {
-      const row = '<tr><td colspan="4">No records yet.</td></tr>';
-      tbody1.innerHTML = row;
-      tbody2.innerHTML = row;
-      return;
-    }
+// Long tables are virtualized: each tbody holds only the rows in view plus
+// spacer rows standing in for the rest, and older records are fetched a page
+// at a time (keyset on timestamp) as the user scrolls towards them.
+const PAGE_SIZE = 50;
+const VIEWPORT_HEIGHT = 480;
+const OVERSCAN = 10;
+
+function createPagedSource(url) {
+  return { url: url, rows: [], pending: [], exhausted: false, loading: null, generation: 0, views: [] };
+}
 
-    const rows = records.map(r => `
-      <tr>
-        <td>${r.date}</td>
-        <td>${r.type}</td>
-        <td>${r.duration}</td>
-        <td><button class="delete-btn" onclick="deleteRecord('${r._id}')">Delete</button></td>
-      </tr>
-    `).join('');
-    tbody1.innerHTML = rows;
-    tbody2.innerHTML = rows;
+const timingSource = createPagedSource(`${API_BASE}/timings`);
+const sessionSource = createPagedSource(`${API_BASE}/sessions`);
+
+function fetchNextPage(source) {
+  if (source.exhausted) return Promise.resolve();
+  if (source.loading) return source.loading;
+  const generation = source.generation;
+  const last = source.rows[source.rows.length - 1];
+  const cursor = last ? `&before=${encodeURIComponent(last.timestamp)}` : '';
+  source.loading = fetch(`${source.url}?limit=${PAGE_SIZE}${cursor}`)
+    .then(r => r.json())
+    .then(page => {
+      if (generation !== source.generation) return;
+      source.loading = null;
+      source.rows.push(...page);
+      if (page.length < PAGE_SIZE) source.exhausted = true;
+      source.views.forEach(renderWindow);
+    })
+    .catch(error => {
+      source.loading = null;
+      console.error('Error loading records:', error);
+    });
+  return source.loading;
+}
+
+function resetSource(source, rows, complete) {
+  source.rows = rows.slice();
+  source.exhausted = !!complete;
+  source.loading = null;
+  source.generation++;
+  source.views.forEach(view => {
+    view.viewport.scrollTop = 0;
+    renderWindow(view);
+  });
+}
+
+let changeSeq = null;
+
+async function pullChanges() {
+  // Applies only what changed since the last dashboard load or pull
+  if (changeSeq === null) return loadDashboard();
+  try {
+    const response = await fetch(`${API_BASE}/changes?since=${changeSeq}`);
+    const feed = await response.json();
+    if (feed.resync) return loadDashboard();
+    feed.changes.forEach(applyChange);
+    changeSeq = feed.seq;
+    if (feed.changes.length) {
+      timingSource.views.forEach(renderWindow);
+      sessionSource.views.forEach(renderWindow);
+      loadStats();
+    }
+    if (feed.more) return pullChanges();
   } catch (error) {
-    console.error('Error loading data:', error);
+    console.error('Error pulling changes:', error);
+  }
+}
+
+function applyChange(change) {
+  if (change.op === 'insert') {
+    insertRow(change.collection === 'timings' ? timingSource : sessionSource, change.record);
+  } else if (change.op === 'delete') {
+    const source = change.collection === 'sessions' ? sessionSource : timingSource;
+    const gone = new Set(change.ids || [change.id]);
+    source.rows = source.rows.filter(r => !gone.has(r._id));
+  } else if (change.op === 'profile') {
+    renderProfile(change.record);
+  } else if (change.op === 'clear') {
+    resetSource(timingSource, [], true);
+    resetSource(sessionSource, [], true);
+    renderProfile({});
   }
 }
 
+function insertRow(source, record) {
+  if (source.rows.some(r => r._id === record._id)) return;
+  const oldest = source.rows[source.rows.length - 1];
+  // Older than every loaded row: it arrives with the page that covers it
+  if (oldest && record.timestamp < oldest.timestamp && !source.exhausted) return;
+  let i = 0;
+  while (i < source.rows.length && source.rows[i].timestamp > record.timestamp) i++;
+  source.rows.splice(i, 0, record);
+}
+
+function removeRow(source, id) {
+  source.rows = source.rows.filter(r => r._id !== id);
+  source.views.forEach(renderWindow);
+}
+
+function attachView(source, tbodyId, colspan, emptyText, renderRow) {
+  const tbody = document.getElementById(tbodyId);
+  const table = tbody.closest('table');
+  const viewport = document.createElement('div');
+  viewport.style.maxHeight = VIEWPORT_HEIGHT + 'px';
+  viewport.style.overflowY = 'auto';
+  table.parentNode.insertBefore(viewport, table);
+  viewport.appendChild(table);
+
+  const view = { source, tbody, viewport, colspan, emptyText, renderRow, rowHeight: 0, frame: 0 };
+  viewport.addEventListener('scroll', () => scheduleRender(view));
+  source.views.push(view);
+  return view;
+}
+
+function scheduleRender(view) {
+  if (view.frame) return;
+  view.frame = requestAnimationFrame(() => {
+    view.frame = 0;
+    renderWindow(view);
+  });
+}
+
+function spacerRow(view, height) {
+  const row = document.createElement('tr');
+  row.style.height = height + 'px';
+  row.innerHTML = `<td colspan="${view.colspan}" style="padding:0;border:0"></td>`;
+  return row;
+}
+
+function renderWindow(view) {
+  const source = view.source;
+  const count = source.pending.length + source.rows.length;
+  if (!count) {
+    view.tbody.innerHTML = `<tr><td colspan="${view.colspan}">${view.emptyText}</td></tr>`;
+    if (!source.exhausted) fetchNextPage(source);
+    return;
+  }
+
+  // Hidden tables measure as zero, so fall back to an estimate until shown
+  const rowHeight = view.rowHeight || 48;
+  const visible = Math.ceil((view.viewport.clientHeight || VIEWPORT_HEIGHT) / rowHeight);
+  const start = Math.max(0, Math.floor(view.viewport.scrollTop / rowHeight) - OVERSCAN);
+  const end = Math.min(count, start + visible + 2 * OVERSCAN);
+
+  // Unsynced local records sit above everything the server has returned
+  const rowAt = i => i < source.pending.length ? source.pending[i] : source.rows[i - source.pending.length];
+  const fragment = document.createDocumentFragment();
+  fragment.appendChild(spacerRow(view, start * rowHeight));
+  for (let i = start; i < end; i++) fragment.appendChild(view.renderRow(rowAt(i), i));
+  fragment.appendChild(spacerRow(view, (count - end) * rowHeight));
+  view.tbody.replaceChildren(fragment);
+
+  if (!view.rowHeight && end > start) view.rowHeight = view.tbody.children[1].offsetHeight;
+  if (end + OVERSCAN >= count) fetchNextPage(source);
+}
+
+function timingRow(r) {
+  const row = document.createElement('tr');
+  row.innerHTML = `
+    <td>${r.date}</td>
+    <td>${r.type}</td>
+    <td>${r.duration}</td>
+    <td><button class="delete-btn" onclick="deleteRecord('${r._id}')">Delete</button></td>
+  `;
+  return row;
+}
+
+async function loadPastData() {
+  resetSource(timingSource, []);
+  await fetchNextPage(timingSource);
+}
+
 async function deleteRecord(id) {
   try {
+    if (id.startsWith('pending-')) {
+      // Not synced yet, so it only has to be dropped from the outbox
+      const key = id.slice('pending-'.length);
+      const ops = await outboxAll();
+      await outboxDelete(ops.filter(op => op.key === key).map(op => op.seq));
+      timingSource.pending = timingSource.pending.filter(r => r._id !== id);
+      timingSource.views.forEach(renderWindow);
+      return;
+    }
     await fetch(`${API_BASE}/timings/${id}`, { method: 'DELETE' });
-    loadPastData();
+    removeRow(timingSource, id);
     loadStats();
   } catch (error) {
     alert('Error deleting record');
@@ -900,127 +2530,79 @@ async function deleteRecord(id) {
 
 async function loadStats() {
   try {
-    const response = await fetch(`${API_BASE}/timings`);
-    const records = await response.json();
-    
-    document.getElementById('total-sessions').textContent = records.length;
-
-    const inh = records.filter(r => r.type === 'Inhalation').map(r => parseFloat(r.duration));
-    const hold = records.filter(r => r.type === 'Breath-Hold').map(r => parseFloat(r.duration));
-    const ex = records.filter(r => r.type === 'Exhalation').map(r => parseFloat(r.duration));
-
-    document.getElementById('avg-inhale').textContent =
-      inh.length ? (inh.reduce((a,b)=>a+b,0)/inh.length).toFixed(2)+'s' : '0.0s';
-    document.getElementById('avg-hold').textContent =
-      hold.length ? (hold.reduce((a,b)=>a+b,0)/hold.length).toFixed(2)+'s' : '0.0s';
-    document.getElementById('avg-exhale').textContent =
-      ex.length ? (ex.reduce((a,b)=>a+b,0)/ex.length).toFixed(2)+'s' : '0.0s';
+    const response = await fetch(`${API_BASE}/stats`);
+    renderStats(await response.json());
   } catch (error) {
     console.error('Error loading stats:', error);
   }
 }
 
-async function saveBreathSession() {
-  try {
-    const response = await fetch(`${API_BASE}/timings`);
-    const records = await response.json();
-    
-    if (!records.length) {
-      alert('No timings saved yet. Save inhale, hold, and exhale first.');
-      return;
-    }
-    
-    const lastInh = records.find(r => r.type === 'Inhalation');
-    const lastHold = records.find(r => r.type === 'Breath-Hold');
-    const lastEx = records.find(r => r.type === 'Exhalation');
+function renderStats(stats) {
+  document.getElementById('total-sessions').textContent = stats.total_timings;
 
-    if (!lastInh || !lastHold || !lastEx) {
-      alert('Need at least one Inhalation, Breath-Hold, and Exhalation timing to save a session.');
-      return;
-    }
+  document.getElementById('avg-inhale').textContent =
+    stats.avg_inhale ? stats.avg_inhale.toFixed(2)+'s' : '0.0s';
+  document.getElementById('avg-hold').textContent =
+    stats.avg_hold ? stats.avg_hold.toFixed(2)+'s' : '0.0s';
+  document.getElementById('avg-exhale').textContent =
+    stats.avg_exhale ? stats.avg_exhale.toFixed(2)+'s' : '0.0s';
+}
 
-    await fetch(`${API_BASE}/sessions`, {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({
-        inhale: lastInh.duration,
-        hold: lastHold.duration,
-        exhale: lastEx.duration
-      })
-    });
-    
+async function saveBreathSession() {
+  try {
+    await queueChange('assemble', {});
     alert('Breath session saved. Go to "Breath Timing" and click Process Data.');
-    loadTimingSessions();
   } catch (error) {
     alert('Error saving session');
   }
 }
 
 async function processSessions() {
-  try {
-    const response = await fetch(`${API_BASE}/sessions`);
-    const sessions = await response.json();
-    
-    if (!sessions.length) {
-      alert('No sessions to process. Save a session first.');
-      return;
-    }
-
-    const tbody = document.getElementById('timing-save-table');
-    tbody.innerHTML = '';
-    let idx = 1;
-
-    sessions.forEach(s => {
-      const h = s.hold / s.inhale;
-      const e = s.exhale / s.inhale;
-      const D = Math.sqrt((h - 4)**2 + (e - 2)**2);
-      let category = 'Needs Attention';
-      let chipClass = 'chip-bad';
-      let rowClass = 'highlight-bad';
-
-      if (D <= 1) {
-        category = 'Healthy';
-        chipClass = 'chip-good';
-        rowClass = 'highlight-good';
-      } else if (D <= 2) {
-        category = 'Borderline';
-        chipClass = 'chip-borderline';
-        rowClass = 'highlight-borderline';
-      }
-
-      const row = document.createElement('tr');
-      row.className = rowClass;
-      row.innerHTML = `
-        <td>#${idx++}</td>
-        <td>${s.inhale.toFixed(2)}</td>
-        <td>${s.hold.toFixed(2)}</td>
-        <td>${s.exhale.toFixed(2)}</td>
-        <td>${h.toFixed(2)} : ${e.toFixed(2)}</td>
-        <td>${D.toFixed(2)}</td>
-        <td><span class="chip ${chipClass}">${category}</span></td>
-        <td>${s.date}</td>
-      `;
-      tbody.appendChild(row);
-    });
-  } catch (error) {
-    console.error('Error processing sessions:', error);
+  resetSource(sessionSource, []);
+  await fetchNextPage(sessionSource);
+  if (!sessionSource.rows.length) {
+    alert('No sessions to process. Save a session first.');
   }
 }
 
+function analyseSession(s) {
+  const h = s.hold / s.inhale;
+  const e = s.exhale / s.inhale;
+  const D = Math.sqrt((h - 4)**2 + (e - 2)**2);
+  let category = 'Needs Attention';
+  if (D <= 1) category = 'Healthy';
+  else if (D <= 2) category = 'Borderline';
+  return Object.assign({}, s, { ratio_h: h, ratio_e: e, deviation: D, category: category });
+}
+
+const CATEGORY_STYLES = {
+  'Healthy': ['chip-good', 'highlight-good'],
+  'Borderline': ['chip-borderline', 'highlight-borderline'],
+  'Needs Attention': ['chip-bad', 'highlight-bad']
+};
+
+function sessionRow(session, i) {
+  const s = analyseSession(session);
+  const [chipClass, rowClass] = CATEGORY_STYLES[s.category];
+  const fmt = x => (x === null || x === undefined) ? '-' : x.toFixed(2);
+  const row = document.createElement('tr');
+  row.className = rowClass;
+  row.innerHTML = `
+    <td>#${i + 1}</td>
+    <td>${s.inhale.toFixed(2)}</td>
+    <td>${s.hold.toFixed(2)}</td>
+    <td>${s.exhale.toFixed(2)}</td>
+    <td>${fmt(s.ratio_h)} : ${fmt(s.ratio_e)}</td>
+    <td>${fmt(s.deviation)}</td>
+    <td><span class="chip ${chipClass}">${s.category}</span></td>
+    <td>${s.date}</td>
+  `;
+  return row;
+}
+
 async function loadTimingSessions() {
-  try {
-    const response = await fetch(`${API_BASE}/sessions`);
-    const sessions = await response.json();
-    
-    const tbody = document.getElementById('timing-save-table');
-    if (!sessions.length) {
-      tbody.innerHTML = '<tr><td colspan="8">No complete sessions saved yet.</td></tr>';
-      return;
-    }
-    processSessions();
-  } catch (error) {
-    console.error('Error loading sessions:', error);
-  }
+  resetSource(sessionSource, []);
+  await fetchNextPage(sessionSource);
 }
 
 async function saveProfile() {
@@ -1036,11 +2618,7 @@ async function saveProfile() {
   };
   
   try {
-    await fetch(`${API_BASE}/profile`, {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify(profile)
-    });
+    await queueChange('profile', profile);
   } catch (error) {
     console.error('Error saving profile:', error);
   }
@@ -1079,21 +2657,37 @@ async function submitProfile() {
 async function loadProfile() {
   try {
     const response = await fetch(`${API_BASE}/profile`);
-    const profile = await response.json();
-    
-    document.getElementById('fullName').value = profile.fullName || '';
-    document.getElementById('age').value = profile.age || '';
-    document.getElementById('email').value = profile.email || '';
-    document.getElementById('phone').value = profile.phone || '';
-    document.getElementById('height').value = profile.height || '';
-    document.getElementById('weight').value = profile.weight || '';
-    document.getElementById('medical').value = profile.medical || '';
-    document.getElementById('notes').value = profile.notes || '';
+    renderProfile(await response.json());
   } catch (error) {
     console.error('Error loading profile:', error);
   }
 }
 
+function renderProfile(profile) {
+  document.getElementById('fullName').value = profile.fullName || '';
+  document.getElementById('age').value = profile.age || '';
+  document.getElementById('email').value = profile.email || '';
+  document.getElementById('phone').value = profile.phone || '';
+  document.getElementById('height').value = profile.height || '';
+  document.getElementById('weight').value = profile.weight || '';
+  document.getElementById('medical').value = profile.medical || '';
+  document.getElementById('notes').value = profile.notes || '';
+}
+
+async function loadDashboard() {
+  try {
+    const response = await fetch(`${API_BASE}/dashboard?limit=${PAGE_SIZE}`);
+    const dashboard = await response.json();
+    changeSeq = dashboard.seq;
+    resetSource(timingSource, dashboard.timings, dashboard.timings.length < PAGE_SIZE);
+    renderStats(dashboard.stats);
+    resetSource(sessionSource, dashboard.sessions, dashboard.sessions.length < PAGE_SIZE);
+    renderProfile(dashboard.profile);
+  } catch (error) {
+    console.error('Error loading dashboard:', error);
+  }
+}
+
 async function clearAllData() {
   if (confirm('This will delete all saved timings, sessions, and profile. Continue?')) {
     try {
@@ -1111,25 +2705,248 @@ function showSection(ev, id) {
   document.querySelectorAll('.nav-btn').forEach(b => b.classList.remove('active'));
   ev.target.classList.add('active');
 
-  if (id === 'past-data') loadPastData();
-  if (id === 'timing-save') { loadStats(); loadTimingSessions(); }
+  if (id === 'past-data' || id === 'timing-save') pullChanges();
   if (id === 'profile') loadProfile();
 }
 
 window.addEventListener('DOMContentLoaded', () => {
   updateDisplay();
-  loadPastData();
-  loadStats();
-  loadProfile();
-  loadTimingSessions();
+  attachView(timingSource, 'past-data-table', 4, 'No records yet.', timingRow);
+  attachView(timingSource, 'past-data-table-2', 4, 'No records yet.', timingRow);
+  attachView(sessionSource, 'timing-save-table', 8, 'No complete sessions saved yet.', sessionRow);
+  loadDashboard().then(showPendingTimings);
+});
+
+window.addEventListener('online', () => {
+  scheduleSync(0);
+  pullChanges();
+});
+
+document.addEventListener('visibilitychange', () => {
+  if (document.hidden) {
+    stopFrames();
+  } else {
+    updateDisplay();
+    scheduleFrame();
+    pullChanges();
+  }
 });
 </script>
 </body>
 </html>'''
 
+# Replica mode (BREATH_REPLICA=1): serve reads from in-memory state kept up
+# to date by tailing the primary's BREATH_MUTATION_LOG. Lag is the time since
+# the replica last reached the end of the log; reads are refused once it
+# exceeds REPLICA_MAX_LAG so clients fall back to the primary.
+REPLICA_POLL_INTERVAL = float(os.environ.get('BREATH_REPLICA_POLL', '0.2'))
+REPLICA_MAX_LAG = float(os.environ.get('BREATH_REPLICA_MAX_LAG', '5'))
+
+replica_state = {'seq': 0, 'applied': 0, 'resyncs': 0, 'caught_up_at': None}
+
+def reload_archive():
+    global archive_manifest
+    archive_manifest = load_manifest()
+    with segment_lock:
+        segment_cache.clear()
+
+def resync_replica():
+    with storage_lock:
+        reload_archive()
+        storage.update(drop_archived(load_data()))
+        build_timing_index()
+        count_tombstones()
+        build_trends()
+        mark_changed('timings', 'sessions', 'profile')
+        replica_state['seq'] = storage.get('log_seq', 0)
+        replica_state['resyncs'] += 1
+        reset_change_feed()
+
+def apply_logged(entry):
+    op = entry['op']
+    if op == 'timing':
+        timing = entry['record']
+        if timing['timestamp'][:10] in archive_manifest:
+            reload_archive()
+        else:
+            storage['timings'].append(timing)
+            index_timing(timing)
+        mark_changed('timings')
+    elif op == 'remove_timing':
+        removed = [t for t in storage['timings'] if t['_id'] == entry['id'] and not t.get('deleted')]
+        storage['timings'] = [t for t in storage['timings'] if t['_id'] != entry['id'] or t.get('deleted')]
+        for timing in removed:
+            unindex_timing(timing)
+        if not removed:
+            reload_archive()
+        mark_changed('timings')
+    elif op in ('delete_timings', 'delete_sessions'):
+        kind = 'timings' if op == 'delete_timings' else 'sessions'
+        ids = set(entry['ids'])
+        for record in storage[kind]:
+            if record['_id'] in ids:
+                record['deleted'] = True
+        count_tombstones()
+        if kind == 'timings':
+            reload_archive()
+            build_timing_index()
+        else:
+            build_trends()
+        mark_changed(kind)
+    elif op == 'compact':
+        compact_storage()
+    elif op == 'session':
+        storage['sessions'].append(entry['record'])
+        track_session(entry['record'])
+        mark_changed('sessions')
+    elif op == 'profile':
+        storage['profile'] = entry['record']
+        mark_changed('profile')
+    elif op == 'clear':
+        storage.update({'timings': [], 'sessions': [], 'profile': {}, 'idempotency': {}})
+        reload_archive()
+        build_timing_index()
+        count_tombstones()
+        reset_trends()
+        mark_changed('timings', 'sessions', 'profile')
+    elif op == 'archive':
+        reload_archive()
+        drop_archived(storage)
+        build_timing_index()
+        mark_changed('timings')
+    storage['log_seq'] = replica_state['seq'] = entry['seq']
+    replica_state['applied'] += 1
+    remember_changes([entry])
+
+def replica_worker():
+    resync_replica()
+    log, inode = None, None
+    while True:
+        try:
+            if log is None:
+                log = open(MUTATION_LOG, 'r')
+                inode = os.fstat(log.fileno()).st_ino
+            while True:
+                position = log.tell()
+                line = log.readline()
+                if not line.endswith('\n'):
+                    # Partial line still being written: retry it on the next poll
+                    log.seek(position)
+                    break
+                entry = json.loads(line)
+                if entry['seq'] <= replica_state['seq']:
+                    continue
+                if entry['seq'] != replica_state['seq'] + 1:
+                    # Missed entries (rotated while behind): start over from the data file
+                    resync_replica()
+                    if entry['seq'] != replica_state['seq'] + 1:
+                        continue
+                with storage_lock:
+                    apply_logged(entry)
+            replica_state['caught_up_at'] = time.time()
+            if os.stat(MUTATION_LOG).st_ino != inode:
+                log.close()
+                log = None
+                continue
+        except FileNotFoundError:
+            # No log yet (or caught mid-rotation): the data file is the whole state
+            if log is None:
+                signature = file_signature()
+                if signature != store_state['signature']:
+                    resync_replica()
+                    store_state['signature'] = signature
+                replica_state['caught_up_at'] = time.time()
+        except Exception as e:
+            print(f"Replica error: {e}")
+        time.sleep(REPLICA_POLL_INTERVAL)
+
+def replica_lag():
+    if replica_state['caught_up_at'] is None:
+        return None
+    return round(time.time() - replica_state['caught_up_at'], 3)
+
+if REPLICA:
+    run_in_background(replica_worker, 'breath-replica')
+
+@app.before_request
+def serve_replica_reads():
+    if not REPLICA or not request.path.startswith('/api/'):
+        return None
+    if request.method in ('POST', 'DELETE') and request.path not in READ_ONLY_POSTS:
+        return jsonify({'error': 'Read-only replica; send writes to the primary'}), 405
+    lag = replica_lag()
+    if lag is None or lag > REPLICA_MAX_LAG:
+        response = jsonify({'error': 'Replica is behind the primary', 'lag_seconds': lag})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    return None
+
+@app.after_request
+def report_replica_lag(response):
+    if REPLICA:
+        response.headers['X-Replica-Seq'] = str(replica_state['seq'])
+        response.headers['X-Replica-Lag'] = str(replica_lag())
+    return response
+
+@app.before_request
+def await_warm_up():
+    if indexes_ready.is_set() or request.path in ('/health', '/ready'):
+        return None
+    if indexes_ready.wait(WARMUP_WAIT):
+        return None
+    response = jsonify({'error': 'Server is warming up, try again shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+@app.before_request
+def sync_shared_store():
+    if SHARED_STORE and file_signature() != store_state['signature']:
+        with storage_lock:
+            refresh_storage()
+
+@app.before_request
+def replay_idempotent_write():
+    if request.method != 'POST' or request.path not in IDEMPOTENT_PATHS:
+        return None
+    key = idempotency_key()
+    existing = find_idempotent(key) if key else None
+    if existing is None:
+        return None
+    response = jsonify({'success': True, 'id': existing})
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+@app.before_request
+def admit_write():
+    if request.method not in ('POST', 'DELETE') or not request.path.startswith('/api/'):
+        return None
+    if request.path in READ_ONLY_POSTS:
+        return None
+    allowed, wait = take_token(request.headers.get('X-Client-Id') or request.remote_addr)
+    if not allowed:
+        write_stats['throttled'] += 1
+        response = jsonify({'error': 'Too many writes, slow down'})
+        response.headers['Retry-After'] = str(max(wait, 1))
+        return response, 429
+    if write_queue.full():
+        return write_queue_busy()
+    write_stats['accepted'] += 1
+    return None
+
+def write_queue_busy():
+    write_stats['rejected'] += 1
+    response = jsonify({'error': 'Server busy, try again later'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+# The page has no per-request context, so it is rendered once
+page_cache = {}
+
 @app.route('/')
 def home():
-    return render_template_string(HTML_TEMPLATE)
+    if 'home' not in page_cache:
+        page_cache['home'] = render_template_string(HTML_TEMPLATE)
+    return page_cache['home']
 
 @app.route('/api')
 def api_info():
@@ -1144,10 +2961,27 @@ def api_info():
 def health():
     return jsonify({
         'status': 'healthy',
-        'timings_count': len(storage['timings']),
-        'sessions_count': len(storage['sessions'])
+        'timings_count': len(storage['timings']) - tombstone_counts['timings'] + archived_count(),
+        'sessions_count': len(storage['sessions']) - tombstone_counts['sessions'],
+        'tombstones': dict(tombstone_counts),
+        'archive': {'segments': len(archive_manifest), 'timings': archived_count()},
+        'cache': dict(cache_stats, size=len(response_cache)),
+        'writes': dict(write_stats, queued=write_queue.qsize(), capacity=WRITE_QUEUE_DEPTH),
+        'store': {'backend': 'file' if docstore is None else 'mongo', 'shared': SHARED_STORE,
+                  'pid': os.getpid(), 'reloads': store_state['reloads']},
+        'replica': dict(replica_state, lag_seconds=replica_lag()) if REPLICA else None,
+        'log_seq': storage.get('log_seq', 0),
+        'tracing': dict(trace_stats, file=TRACE_FILE or None, sample_rate=TRACE_SAMPLE_RATE),
+        'jobs': dict(job_stats, queued=job_queue.qsize(), capacity=JOB_QUEUE_DEPTH, stored=len(jobs)),
+        'startup': startup_state
     })
 
+@app.route('/ready')
+def ready():
+    if not startup_state['ready']:
+        return jsonify({'ready': False, 'startup': startup_state}), 503
+    return jsonify({'ready': True, 'startup': startup_state})
+
 @app.route('/api/timings', methods=['POST'])
 def save_timing():
     try:
@@ -1155,34 +2989,72 @@ def save_timing():
         if not data or 'type' not in data or 'duration' not in data:
             return jsonify({'error': 'Missing required fields'}), 400
             
-        timing = {
-            '_id': str(len(storage['timings'])),
-            'timestamp': datetime.now().isoformat(),
-            'type': data['type'],
-            'duration': float(data['duration']),
-            'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
-        
-        storage['timings'].append(timing)
-        save_data(storage)
-        return jsonify({'success': True, 'id': timing['_id']})
+        timing = make_timing(data)
+        timing_id = submit_write(idempotent, idempotency_key(), insert_timing, timing)
+        return jsonify({'success': True, 'id': timing_id})
+    except queue.Full:
+        return write_queue_busy()
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/timings', methods=['GET'])
 def get_timings():
     try:
-        timings = sorted(storage['timings'], key=lambda x: x['timestamp'], reverse=True)
-        return jsonify(timings)
+        timing_type = request.args.get('type') or None
+        if timing_type and timing_type not in TIMING_TYPES:
+            return jsonify({'error': 'Unknown timing type'}), 400
+        limit = request.args.get('limit')
+        if limit is not None:
+            if not limit.isdigit():
+                return jsonify({'error': 'limit must be a non-negative integer'}), 400
+            limit = int(limit)
+        start = request.args.get('from') or None
+        end = request.args.get('to') or None
+        before = request.args.get('before') or None
+        query = query_timings if docstore is None else docstore_timings
+        return cached_response('timings', ['timings'],
+                               lambda: query(timing_type, start, end, limit, before))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/timings', methods=['DELETE'])
+def delete_timing_range():
+    try:
+        timing_type = request.args.get('type') or None
+        if timing_type and timing_type not in TIMING_TYPES:
+            return jsonify({'error': 'Unknown timing type'}), 400
+        start = request.args.get('from') or None
+        end = request.args.get('to') or None
+        if not (timing_type or start or end):
+            return jsonify({'error': 'Give type, from or to; use /api/clear to delete everything'}), 400
+        deleted = submit_write(delete_timings, timing_type, start, end)
+        return jsonify({'success': True, 'deleted': deleted})
+    except queue.Full:
+        return write_queue_busy()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/sessions', methods=['DELETE'])
+def delete_session_range():
+    try:
+        start = request.args.get('from') or None
+        end = request.args.get('to') or None
+        if not (start or end):
+            return jsonify({'error': 'Give from or to; use /api/clear to delete everything'}), 400
+        deleted = submit_write(delete_sessions, start, end)
+        return jsonify({'success': True, 'deleted': deleted})
+    except queue.Full:
+        return write_queue_busy()
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/timings/<timing_id>', methods=['DELETE'])
 def delete_timing(timing_id):
     try:
-        storage['timings'] = [t for t in storage['timings'] if t['_id'] != timing_id]
-        save_data(storage)
+        submit_write(remove_timing, timing_id)
         return jsonify({'success': True})
+    except queue.Full:
+        return write_queue_busy()
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1193,26 +3065,69 @@ def save_session():
         if not data or not all(k in data for k in ['inhale', 'hold', 'exhale']):
             return jsonify({'error': 'Missing required fields'}), 400
             
-        session = {
-            '_id': str(len(storage['sessions'])),
-            'date': datetime.now().strftime('%Y-%m-%d'),
-            'inhale': float(data['inhale']),
-            'hold': float(data['hold']),
-            'exhale': float(data['exhale']),
-            'timestamp': datetime.now().isoformat()
-        }
-        
-        storage['sessions'].append(session)
-        save_data(storage)
-        return jsonify({'success': True, 'id': session['_id']})
+        session = make_session(data)
+        session_id = submit_write(idempotent, idempotency_key(), insert_session, session)
+        return jsonify({'success': True, 'id': session_id})
+    except queue.Full:
+        return write_queue_busy()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/batch', methods=['POST'])
+def save_batch():
+    try:
+        data = request.get_json()
+        operations = data.get('operations') if isinstance(data, dict) else None
+        if not isinstance(operations, list) or not operations:
+            return jsonify({'error': 'No operations provided'}), 400
+        if len(operations) > BATCH_MAX_OPERATIONS:
+            return jsonify({'error': f'At most {BATCH_MAX_OPERATIONS} operations per batch'}), 400
+
+        results = []
+        prepared = []
+        for op in operations:
+            op = op if isinstance(op, dict) else {}
+            result = {'key': op.get('key'), 'op': op.get('op')}
+            results.append(result)
+            try:
+                prepared.append((result,) + prepare_operation(op))
+            except (TypeError, ValueError, OverflowError) as e:
+                result.update(status=400, error=str(e))
+        if prepared:
+            submit_write(apply_batch, prepared)
+        return jsonify({'success': True, 'results': results})
+    except queue.Full:
+        return write_queue_busy()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/sessions/assemble', methods=['POST'])
+def assemble_latest_session():
+    try:
+        data = request.get_json(silent=True) or {}
+        start = data.get('from') or request.args.get('from') or None
+        end = data.get('to') or request.args.get('to') or None
+        session_id = submit_write(idempotent, idempotency_key(), assemble_session, start, end)
+        if session_id is None:
+            return jsonify({'error': 'Need an Inhalation, Breath-Hold and Exhalation timing'}), 400
+        return jsonify({'success': True, 'id': session_id})
+    except queue.Full:
+        return write_queue_busy()
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/sessions', methods=['GET'])
 def get_sessions():
     try:
-        sessions = sorted(storage['sessions'], key=lambda x: x['timestamp'], reverse=True)
-        return jsonify(sessions)
+        limit = request.args.get('limit')
+        if limit is not None:
+            if not limit.isdigit():
+                return jsonify({'error': 'limit must be a non-negative integer'}), 400
+            limit = int(limit)
+        start = request.args.get('from') or None
+        before = request.args.get('before') or None
+        return cached_response('sessions', ['sessions'],
+                               lambda: query_sessions(start, before, limit))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1223,61 +3138,666 @@ def save_profile():
         if not data:
             return jsonify({'error': 'No data provided'}), 400
             
-        storage['profile'] = {
-            'fullName': data.get('fullName', ''),
-            'age': data.get('age', ''),
-            'email': data.get('email', ''),
-            'phone': data.get('phone', ''),
-            'height': data.get('height', ''),
-            'weight': data.get('weight', ''),
-            'medical': data.get('medical', ''),
-            'notes': data.get('notes', ''),
-            'updated': datetime.now().isoformat()
-        }
-        
-        save_data(storage)
+        submit_write(set_profile, make_profile(data))
         return jsonify({'success': True})
+    except queue.Full:
+        return write_queue_busy()
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/profile', methods=['GET'])
 def get_profile():
     try:
-        return jsonify(storage.get('profile', {}))
+        return cached_response('profile', ['profile'], lambda: storage.get('profile', {}))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/clear', methods=['DELETE'])
 def clear_all_data():
     try:
-        storage['timings'] = []
-        storage['sessions'] = []
-        storage['profile'] = {}
-        save_data(storage)
+        submit_write(clear_storage)
         return jsonify({'success': True, 'message': 'All data cleared'})
+    except queue.Full:
+        return write_queue_busy()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def compute_stats():
+    if docstore is not None:
+        return docstore_stats()
+    totals = {name: list(timing_totals.get(name, (0, 0.0))) for name in TIMING_TYPES}
+    # Archived segments contribute their precomputed per-type sums
+    for summary in archive_manifest.values():
+        for name, (count, total) in summary['types'].items():
+            if name in totals:
+                totals[name][0] += count
+                totals[name][1] += total
+
+    def avg(name):
+        count, total = totals[name]
+        return total / count if count else 0
+    
+    return {
+        'total_timings': len(storage['timings']) - tombstone_counts['timings'] + archived_count(),
+        'total_sessions': len(storage['sessions']) - tombstone_counts['sessions'],
+        'avg_inhale': avg('Inhalation'),
+        'avg_hold': avg('Breath-Hold'),
+        'avg_exhale': avg('Exhalation')
+    }
+
+def query_sessions(start=None, before=None, limit=None):
+    sessions = [s for s in storage['sessions']
+                if not s.get('deleted')
+                and (not start or s['timestamp'] >= start)
+                and (not before or s['timestamp'] < before)]
+    sessions.sort(key=lambda x: x['timestamp'], reverse=True)
+    return sessions[:limit] if limit is not None else sessions
+
+def build_dashboard(limit):
+    # Taken under the storage lock so all parts reflect the same set of writes
+    with storage_lock:
+        return {
+            'timings': query_timings(limit=limit),
+            'stats': compute_stats(),
+            'sessions': [analyse_session(s) for s in query_sessions(limit=limit)],
+            'profile': storage.get('profile', {}),
+            'seq': storage.get('log_seq', 0)
+        }
+
+@app.route('/api/dashboard', methods=['GET'])
+def get_dashboard():
+    try:
+        limit = request.args.get('limit', '50')
+        if not limit.isdigit():
+            return jsonify({'error': 'limit must be a non-negative integer'}), 400
+        return cached_response('dashboard', ['timings', 'sessions', 'profile'],
+                               lambda: build_dashboard(int(limit)))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+CHANGE_VIEWS = {
+    'timing': lambda e: {'op': 'insert', 'collection': 'timings', 'record': e['record']},
+    'session': lambda e: {'op': 'insert', 'collection': 'sessions', 'record': e['record']},
+    'remove_timing': lambda e: {'op': 'delete', 'collection': 'timings', 'id': e['id']},
+    'delete_timings': lambda e: {'op': 'delete', 'collection': 'timings', 'ids': e['ids']},
+    'delete_sessions': lambda e: {'op': 'delete', 'collection': 'sessions', 'ids': e['ids']},
+    'profile': lambda e: {'op': 'profile', 'record': e['record']},
+    'clear': lambda e: {'op': 'clear'}
+}
+
+def build_changes(since, limit):
+    with storage_lock:
+        latest = storage.get('log_seq', 0)
+        if since < feed_state['floor'] or since > latest:
+            # Fell out of the feed (or the store was replaced): refetch everything
+            return {'seq': latest, 'resync': True, 'more': False, 'changes': []}
+        entries = [e for e in change_feed if e['seq'] > since]
+    more = len(entries) > limit
+    entries = entries[:limit]
+    return {
+        'seq': entries[-1]['seq'] if more else latest,
+        'resync': False,
+        'more': more,
+        # Archiving moves timings between tiers without changing what reads return
+        'changes': [dict(CHANGE_VIEWS[e['op']](e), seq=e['seq']) for e in entries if e['op'] in CHANGE_VIEWS]
+    }
+
+@app.route('/api/changes', methods=['GET'])
+def get_changes():
+    try:
+        since = request.args.get('since', '')
+        limit = request.args.get('limit', '500')
+        if not since.isdigit() or not limit.isdigit():
+            return jsonify({'error': 'since and limit must be non-negative integers'}), 400
+        return cached_response('changes', ['timings', 'sessions', 'profile'],
+                               lambda: build_changes(int(since), max(int(limit), 1)))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Chart series: timings in time order, reduced to at most N points with
+# Largest-Triangle-Three-Buckets, which keeps the first and last point and
+# from each bucket the point spanning the largest triangle with its
+# neighbours, so peaks and dips survive the downsampling.
+SERIES_DEFAULT_POINTS = 500
+SERIES_MAX_POINTS = 5000
+
+def lttb(xs, ys, threshold):
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+    every = (n - 2) / (threshold - 2)
+    picked = [0]
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third corner of the triangle
+        start = int((i + 1) * every) + 1
+        end = min(int((i + 2) * every) + 1, n)
+        avg_x = sum(xs[start:end]) / (end - start)
+        avg_y = sum(ys[start:end]) / (end - start)
+        lo = int(i * every) + 1
+        hi = int((i + 1) * every) + 1
+        ax, ay = xs[a], ys[a]
+        best, best_area = lo, -1.0
+        for j in range(lo, hi):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        picked.append(best)
+        a = best
+    picked.append(n - 1)
+    return picked
+
+def build_series(timing_type, start, end, points):
+    series = {}
+    for name in ([timing_type] if timing_type else TIMING_TYPES):
+        records = query_timings(name, start, end)[::-1]
+        xs = [datetime.fromisoformat(t['timestamp']).timestamp() for t in records]
+        ys = [float(t['duration']) for t in records]
+        series[name] = {
+            'total': len(records),
+            'points': [[records[i]['timestamp'], ys[i]] for i in lttb(xs, ys, points)]
+        }
+    return series
+
+@app.route('/api/series', methods=['GET'])
+def get_series():
+    try:
+        timing_type = request.args.get('type') or None
+        if timing_type and timing_type not in TIMING_TYPES:
+            return jsonify({'error': 'Unknown timing type'}), 400
+        points = request.args.get('points', str(SERIES_DEFAULT_POINTS))
+        if not points.isdigit() or not 3 <= int(points) <= SERIES_MAX_POINTS:
+            return jsonify({'error': f'points must be an integer from 3 to {SERIES_MAX_POINTS}'}), 400
+        start = request.args.get('from') or None
+        end = request.args.get('to') or None
+        return cached_response('series', ['timings'],
+                               lambda: build_series(timing_type, start, end, int(points)))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/trends', methods=['GET'])
+def get_trends():
+    try:
+        return cached_response('trends', ['sessions'], trend_report)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Cohort report written by `python cohort.py`; reloaded only when the file changes
+COHORT_REPORT_FILE = os.environ.get('BREATH_COHORT_REPORT', 'cohort_report.json')
+# What the cohort job may read and how many processes it may start are fixed
+# here, never taken from the request
+COHORT_SHARDS = [p for p in os.environ.get('BREATH_COHORT_SHARDS', '').split(',') if p] or [DATA_FILE]
+COHORT_WORKERS = int(os.environ.get('BREATH_COHORT_WORKERS', '2'))
+cohort_cache = {'signature': None, 'report': None}
+
+def load_cohort_report():
+    st = os.stat(COHORT_REPORT_FILE)
+    signature = (st.st_mtime_ns, st.st_size)
+    if cohort_cache['signature'] != signature:
+        with open(COHORT_REPORT_FILE, 'r') as f:
+            cohort_cache['report'] = json.load(f)
+        cohort_cache['signature'] = signature
+    return cohort_cache['report'], signature
+
+@app.route('/api/cohort', methods=['GET'])
+def get_cohort():
+    try:
+        try:
+            report, signature = load_cohort_report()
+        except FileNotFoundError:
+            return jsonify({'error': 'Cohort report has not been built; run python cohort.py'}), 404
+        response = jsonify(report)
+        response.set_etag('cohort-%d-%d' % signature, weak=True)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
     try:
-        timings = storage['timings']
-        inhale_times = [float(t['duration']) for t in timings if t['type'] == 'Inhalation']
-        hold_times = [float(t['duration']) for t in timings if t['type'] == 'Breath-Hold']
-        exhale_times = [float(t['duration']) for t in timings if t['type'] == 'Exhalation']
-        
-        stats = {
-            'total_timings': len(timings),
-            'total_sessions': len(storage['sessions']),
-            'avg_inhale': sum(inhale_times) / len(inhale_times) if inhale_times else 0,
-            'avg_hold': sum(hold_times) / len(hold_times) if hold_times else 0,
-            'avg_exhale': sum(exhale_times) / len(exhale_times) if exhale_times else 0
+        return cached_response('stats', ['timings', 'sessions'], compute_stats)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Bulk scoring of uploaded (inhale, hold, exhale) triples with the session
+# rule, without storing anything. Input is read and scored a chunk at a time
+# with NumPy and streamed back as NDJSON (one columnar object per chunk and a
+# final summary line) or, for Accept: application/octet-stream, as packed
+# little-endian records with no per-row formatting at all.
+SCORE_CHUNK_ROWS = int(os.environ.get('BREATH_SCORE_CHUNK_ROWS', '65536'))
+SCORE_READ_SIZE = 1 << 20
+SCORE_CATEGORIES = ['Healthy', 'Borderline', 'Needs Attention']
+
+def score_chunk(triples):
+    inhale, hold, exhale = triples[:, 0], triples[:, 1], triples[:, 2]
+    valid = inhale > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        h = hold / inhale
+        e = exhale / inhale
+        d = np.sqrt((h - 4) ** 2 + (e - 2) ** 2)
+    codes = np.where(d <= 1, 0, np.where(d <= 2, 1, 2))
+    codes[~valid] = 2
+    # Rows without a positive inhale have no ratios; NaN is written as null
+    h[~valid] = e[~valid] = d[~valid] = np.nan
+    return valid, h, e, d, codes
+
+def read_lines(stream):
+    rest = b''
+    while True:
+        block = stream.read(SCORE_READ_SIZE)
+        if not block:
+            break
+        block = rest + block
+        cut = block.rfind(b'\n') + 1
+        rest = block[cut:]
+        if cut:
+            yield block[:cut]
+    if rest.strip():
+        yield rest
+
+def is_header(line):
+    try:
+        [float(field) for field in line.split(b',')[:3]]
+        return False
+    except ValueError:
+        return True
+
+def parse_csv(stream):
+    first = True
+    for block in read_lines(stream):
+        if first:
+            first = False
+            line = block.split(b'\n', 1)[0]
+            if is_header(line):
+                block = block[len(line) + 1:]
+        if block.strip():
+            yield np.loadtxt(io.BytesIO(block), delimiter=',', usecols=(0, 1, 2), ndmin=2)
+
+def parse_ndjson(stream):
+    for block in read_lines(stream):
+        lines = [line for line in block.split(b'\n') if line.strip()]
+        if not lines:
+            continue
+        rows = json.loads(b'[' + b','.join(lines) + b']')
+        rows = [[r['inhale'], r['hold'], r['exhale']] if isinstance(r, dict) else r for r in rows]
+        yield np.array(rows, dtype=float).reshape(-1, 3)
+
+def parse_binary(stream, dtype):
+    row_bytes = 3 * dtype.itemsize
+    size = SCORE_CHUNK_ROWS * row_bytes
+    rest = b''
+    while True:
+        block = stream.read(size)
+        if not block:
+            break
+        block = rest + block
+        cut = len(block) - len(block) % row_bytes
+        rest = block[cut:]
+        if cut:
+            yield np.frombuffer(block[:cut], dtype=dtype).reshape(-1, 3)
+    if rest:
+        raise ValueError(f'Trailing {len(rest)} bytes do not form a whole triple')
+
+def rechunk(chunks):
+    # Parsers yield whatever a read produced; score in fixed-size slices
+    for chunk in chunks:
+        for i in range(0, len(chunk), SCORE_CHUNK_ROWS):
+            yield chunk[i:i + SCORE_CHUNK_ROWS]
+
+@app.route('/api/score', methods=['POST'])
+def score_sessions():
+    try:
+        if np is None:
+            return jsonify({'error': 'Bulk scoring requires numpy'}), 501
+        content_type = request.mimetype
+        if content_type == 'text/csv':
+            chunks = parse_csv(request.stream)
+        elif content_type in ('application/x-ndjson', 'application/jsonl'):
+            chunks = parse_ndjson(request.stream)
+        elif content_type == 'application/octet-stream':
+            dtype = request.args.get('dtype', 'float32')
+            if dtype not in ('float32', 'float64'):
+                return jsonify({'error': 'dtype must be float32 or float64'}), 400
+            dtype = np.dtype(dtype).newbyteorder('<')
+            if request.content_length is not None and request.content_length % (3 * dtype.itemsize):
+                return jsonify({'error': f'Body is not a whole number of {dtype.name} triples'}), 400
+            chunks = parse_binary(request.stream, dtype)
+        else:
+            return jsonify({'error': 'Send text/csv, application/x-ndjson or application/octet-stream'}), 415
+        summary_only = request.args.get('summary') == '1'
+        binary = request.accept_mimetypes.best == 'application/octet-stream'
+        record = [('ratio_h', '<f4'), ('ratio_e', '<f4'), ('deviation', '<f4'), ('category', 'u1')]
+        # Parse the first chunk before answering, so malformed input gets a 400
+        chunks = rechunk(chunks)
+        try:
+            first = next(chunks, None)
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({'error': f'Could not parse input: {e}'}), 400
+        if first is not None:
+            chunks = itertools.chain([first], chunks)
+
+        def generate():
+            labels = np.array(SCORE_CATEGORIES, dtype=object)
+            counts = np.zeros(3, dtype=np.int64)
+            rows = 0
+            deviation_sum = 0.0
+            scored = 0
+            started = time.perf_counter()
+            try:
+                for triples in chunks:
+                    valid, h, e, d, codes = score_chunk(triples)
+                    counts += np.bincount(codes, minlength=3)
+                    rows += len(triples)
+                    scored += int(valid.sum())
+                    deviation_sum += float(d[valid].sum())
+                    if binary:
+                        out = np.empty(len(triples), dtype=record)
+                        out['ratio_h'], out['ratio_e'], out['deviation'], out['category'] = h, e, d, codes
+                        yield out.tobytes()
+                    elif not summary_only:
+                        yield json.dumps({
+                            'offset': rows - len(triples),
+                            'ratio_h': np.round(h, 4).tolist(),
+                            'ratio_e': np.round(e, 4).tolist(),
+                            'deviation': np.round(d, 4).tolist(),
+                            'category': labels[codes].tolist()
+                        }).replace('NaN', 'null') + '\n'
+            except Exception as e:
+                # Packed records have no room for an error; abort the response
+                # so the client sees a broken stream, not a short one
+                if binary:
+                    raise
+                yield json.dumps({'error': str(e), 'rows': rows}) + '\n'
+                return
+            if binary:
+                return
+            elapsed = time.perf_counter() - started
+            yield json.dumps({'summary': {
+                'rows': rows,
+                'categories': dict(zip(SCORE_CATEGORIES, counts.tolist())),
+                'avg_deviation': deviation_sum / scored if scored else None,
+                'seconds': round(elapsed, 4),
+                'rows_per_second': int(rows / elapsed) if elapsed else None
+            }}) + '\n'
+
+        mimetype = 'application/octet-stream' if binary else 'application/x-ndjson'
+        return Response(stream_with_context(generate()), mimetype=mimetype)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Background jobs for reports too heavy for a request thread. Submissions go
+# into a bounded priority queue drained by a small worker pool; finished jobs
+# are kept for JOB_RESULT_TTL seconds and identical requests against
+# unchanged data reuse the stored result.
+JOB_WORKERS = int(os.environ.get('BREATH_JOB_WORKERS', '2'))
+JOB_QUEUE_DEPTH = int(os.environ.get('BREATH_JOB_QUEUE_DEPTH', '32'))
+JOB_RESULT_TTL = int(os.environ.get('BREATH_JOB_RESULT_TTL', '600'))
+JOB_PRIORITIES = {'high': 0, 'normal': 1, 'low': 2}
+
+job_queue = queue.PriorityQueue(maxsize=JOB_QUEUE_DEPTH)
+jobs = {}
+job_keys = {}
+jobs_lock = threading.Lock()
+job_stats = {'submitted': 0, 'reused': 0, 'completed': 0, 'failed': 0, 'rejected': 0}
+job_sequence = [0]
+
+def read_snapshot(read):
+    with storage_lock:
+        if SHARED_STORE and file_signature() != store_state['signature']:
+            refresh_storage()
+        return read()
+
+def export_job(params, progress):
+    collection = params.get('collection', 'timings')
+    start = params.get('from') or None
+    end = params.get('to') or None
+    if collection == 'timings':
+        records = read_snapshot(lambda: query_timings(params.get('type') or None, start, end))
+    elif collection == 'sessions':
+        records = read_snapshot(lambda: query_sessions(start=start))
+        if end:
+            records = [s for s in records if s['timestamp'] <= end + '\uffff']
+    else:
+        raise ValueError('collection must be timings or sessions')
+    progress(1, 1)
+    return {'collection': collection, 'count': len(records), 'records': records}
+
+def reanalysis_job(params, progress):
+    sessions = read_snapshot(lambda: [s for s in storage['sessions'] if not s.get('deleted')])
+    analysed = []
+    categories = {'Healthy': 0, 'Borderline': 0, 'Needs Attention': 0}
+    for i, session in enumerate(sessions):
+        result = analyse_session(session)
+        categories[result['category']] += 1
+        analysed.append(result)
+        if i % 500 == 0:
+            progress(i, len(sessions))
+    progress(len(sessions), len(sessions))
+    return {'count': len(analysed), 'categories': categories, 'sessions': analysed}
+
+def trend_report_job(params, progress):
+    months = int(params.get('months', 6))
+    since = (datetime.now().replace(day=1) - timedelta(days=31 * (months - 1))).strftime('%Y-%m')
+    sessions = read_snapshot(lambda: query_sessions(start=since))
+    buckets = {}
+    for i, session in enumerate(sessions):
+        result = analyse_session(session)
+        bucket = buckets.setdefault(session['timestamp'][:7], {
+            'sessions': 0, 'scored': 0, 'deviation': 0.0, 'hold_ratio': 0.0,
+            'categories': {'Healthy': 0, 'Borderline': 0, 'Needs Attention': 0}})
+        bucket['sessions'] += 1
+        bucket['categories'][result['category']] += 1
+        if result['deviation'] is not None:
+            bucket['scored'] += 1
+            bucket['deviation'] += result['deviation']
+            bucket['hold_ratio'] += result['ratio_h']
+        if i % 500 == 0:
+            progress(i, len(sessions))
+    report = []
+    for month in sorted(buckets):
+        bucket = buckets[month]
+        scored = bucket.pop('scored')
+        bucket['avg_deviation'] = bucket.pop('deviation') / scored if scored else None
+        bucket['avg_hold_ratio'] = bucket.pop('hold_ratio') / scored if scored else None
+        report.append(dict(bucket, month=month))
+    progress(len(sessions), len(sessions))
+    return {'months': report}
+
+def cohort_job(params, progress):
+    # Runs the cohort command in a fresh interpreter: its process pool must not
+    # start from this multi-threaded server, nor re-import app.py in each child
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cohort.py')
+    done = subprocess.run([sys.executable, script, *COHORT_SHARDS, '--workers', str(COHORT_WORKERS),
+                           '--output', COHORT_REPORT_FILE], capture_output=True, text=True)
+    if done.returncode != 0:
+        raise RuntimeError((done.stderr.strip().splitlines() or ['cohort.py failed'])[-1])
+    report, _ = load_cohort_report()
+    progress(1, 1)
+    return report
+
+JOB_TYPES = {
+    'export': (export_job, ['timings', 'sessions']),
+    'reanalysis': (reanalysis_job, ['sessions']),
+    'trend_report': (trend_report_job, ['sessions']),
+    'cohort': (cohort_job, [])
+}
+
+def job_view(job, include_result=True):
+    view = {k: job[k] for k in ('id', 'type', 'params', 'priority', 'status', 'progress',
+                                'submitted', 'started', 'finished')}
+    if job['status'] == 'failed':
+        view['error'] = job['error']
+    if include_result and job['status'] == 'done':
+        view['result'] = job['result']
+    return view
+
+def evict_jobs():
+    now = time.time()
+    for job_id in [i for i, job in jobs.items() if job['expires'] and job['expires'] <= now]:
+        job = jobs.pop(job_id)
+        if job_keys.get(job['key']) == job_id:
+            del job_keys[job['key']]
+
+def submit_job(job_type, params, priority):
+    versions = tuple(data_versions[kind] for kind in JOB_TYPES[job_type][1])
+    key = (job_type, json.dumps(params, sort_keys=True), versions)
+    with jobs_lock:
+        evict_jobs()
+        existing = jobs.get(job_keys.get(key))
+        if existing and existing['status'] != 'failed':
+            job_stats['reused'] += 1
+            return existing, True
+        job_sequence[0] += 1
+        job = {
+            'id': uuid.uuid4().hex,
+            'type': job_type,
+            'params': params,
+            'priority': priority,
+            'status': 'queued',
+            'progress': 0.0,
+            'submitted': datetime.now().isoformat(),
+            'started': None,
+            'finished': None,
+            'result': None,
+            'error': None,
+            'key': key,
+            'expires': None
         }
-        
-        return jsonify(stats)
+        try:
+            job_queue.put_nowait((JOB_PRIORITIES[priority], job_sequence[0], job['id']))
+        except queue.Full:
+            job_stats['rejected'] += 1
+            return None, False
+        jobs[job['id']] = job
+        job_keys[key] = job['id']
+        job_stats['submitted'] += 1
+        return job, False
+
+def job_worker():
+    while True:
+        _, _, job_id = job_queue.get()
+        job = jobs.get(job_id)
+        if job is None:
+            continue
+        job['status'] = 'running'
+        job['started'] = datetime.now().isoformat()
+
+        def progress(done, total):
+            job['progress'] = round(done / total, 4) if total else 1.0
+
+        try:
+            job['result'] = JOB_TYPES[job['type']][0](job['params'], progress)
+            job['status'] = 'done'
+            job['progress'] = 1.0
+            job_stats['completed'] += 1
+        except Exception as e:
+            job['error'] = str(e)
+            job['status'] = 'failed'
+            job_stats['failed'] += 1
+        job['finished'] = datetime.now().isoformat()
+        job['expires'] = time.time() + JOB_RESULT_TTL
+
+for worker in range(JOB_WORKERS):
+    run_in_background(job_worker, f'breath-job-{worker}')
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    try:
+        data = request.get_json()
+        if not data or data.get('type') not in JOB_TYPES:
+            return jsonify({'error': 'type must be one of ' + ', '.join(JOB_TYPES)}), 400
+        params = data.get('params') or {}
+        if not isinstance(params, dict):
+            return jsonify({'error': 'params must be an object'}), 400
+        priority = data.get('priority', 'normal')
+        if priority not in JOB_PRIORITIES:
+            return jsonify({'error': 'priority must be high, normal or low'}), 400
+
+        job, reused = submit_job(data['type'], params, priority)
+        if job is None:
+            response = jsonify({'error': 'Job queue is full, try again later'})
+            response.headers['Retry-After'] = '5'
+            return response, 503
+        response = jsonify(dict(job_view(job, include_result=False), reused=reused))
+        response.headers['Location'] = f"/api/jobs/{job['id']}"
+        return response, 200 if job['status'] == 'done' else 202
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    try:
+        with jobs_lock:
+            evict_jobs()
+            job = jobs.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found or expired'}), 404
+        return jsonify(job_view(job))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def build_indexes():
+    with startup_phase('index_build'):
+        build_timing_index()
+        count_tombstones()
+        build_trends()
+        # A replica never writes; its data arrives through the mutation log
+        if not REPLICA:
+            with locked_store():
+                if archive_old_timings():
+                    persist()
+    indexes_ready.set()
+
+def warm_caches():
+    # Fills the page and the cached responses the page loads first, in the
+    # encodings browsers ask for
+    with startup_phase('cache_warm'):
+        client = app.test_client()
+        for path in filter(None, WARMUP_PATHS):
+            for coding in ('identity', 'gzip, deflate, br'):
+                client.get(path, headers={'Accept-Encoding': coding}, environ_base={'breath.warm_up': True})
+
+def mark_ready():
+    startup_state['ready'] = True
+    startup_state['ready_after_ms'] = round((time.perf_counter() - startup_began) * 1000, 1)
+    phases = ', '.join(f'{name} {ms} ms' for name, ms in startup_state['phases'].items())
+    print(f"Startup ({startup_state['mode']}): {phases}; ready after {startup_state['ready_after_ms']} ms")
+
+def warm_up():
+    build_indexes()
+    start_background()
+    warm_caches()
+    mark_ready()
+
+def warm_up_in_background():
+    try:
+        warm_up()
+    except Exception as e:
+        # /ready stays 503 and reports why
+        startup_state['error'] = str(e)
+        print(f"Error warming up: {e}")
+
+imported = round((time.perf_counter() - startup_began) * 1000 - startup_state['phases']['storage_open'], 1)
+startup_state['phases'] = {'import': imported, **startup_state['phases']}
+
+# Under the debug reloader this module also runs in the parent process, which
+# only restarts the serving child; its own writer would save a stale copy
+RELOADER_PARENT = __name__ == '__main__' and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'
+
+# A preforking server needs everything built before the fork and starts the
+# background threads itself in each worker
+if PREFORK:
+    build_indexes()
+    warm_caches()
+    mark_ready()
+elif RELOADER_PARENT:
+    pass
+elif LAZY_WARMUP:
+    threading.Thread(target=warm_up_in_background, name='breath-warm-up', daemon=True).start()
+else:
+    warm_up()
+
 if __name__ == '__main__':
     print('=' * 50)
     print('BREATH TIMING STOPWATCH WEBSITE')
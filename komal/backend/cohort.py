@@ -0,0 +1,170 @@
+import argparse
+import glob
+import json
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+# Builds the population report served by GET /api/cohort. Each shard is one
+# patient's data file; shards are reduced to mergeable partial aggregates in
+# a process pool and combined here, so cohort queries never scan sessions on
+# the request path.
+REPORT_FILE = os.environ.get('BREATH_COHORT_REPORT', 'cohort_report.json')
+CATEGORIES = ['Healthy', 'Borderline', 'Needs Attention']
+PERCENTILES = [5, 25, 50, 75, 95]
+
+# Fixed-width histograms double as the quantile sketch: bins add across
+# shards, and percentiles are read off the merged counts
+HOLD_BIN = 0.5
+HOLD_BINS = 600
+RATIO_BIN = 0.5
+RATIO_BINS = 20
+
+def empty_partial():
+    return {
+        'patients': 0,
+        'sessions': 0,
+        'categories': {name: 0 for name in CATEGORIES},
+        'hold': {'count': 0, 'sum': 0.0, 'min': None, 'max': None, 'bins': [0] * HOLD_BINS},
+        'ratio_h': [0] * RATIO_BINS,
+        'ratio_e': [0] * RATIO_BINS,
+        'deviation_sum': 0.0,
+        'errors': []
+    }
+
+def bin_of(value, width, count):
+    return min(max(int(value / width), 0), count - 1)
+
+def classify(session):
+    # Same rule as the API: distance of the h:e ratios from the ideal 4:2
+    if not session['inhale'] > 0:
+        return None, None, None, 'Needs Attention'
+    h = session['hold'] / session['inhale']
+    e = session['exhale'] / session['inhale']
+    d = math.sqrt((h - 4) ** 2 + (e - 2) ** 2)
+    category = 'Healthy' if d <= 1 else 'Borderline' if d <= 2 else 'Needs Attention'
+    return h, e, d, category
+
+def aggregate_shard(path):
+    partial = empty_partial()
+    try:
+        with open(path, 'r') as f:
+            sessions = json.load(f).get('sessions', [])
+    except Exception as e:
+        partial['errors'].append(f'{path}: {e}')
+        return partial
+    partial['patients'] = 1
+    hold = partial['hold']
+    for session in sessions:
+        # Range deletes leave tombstones until the API compacts the file
+        if session.get('deleted'):
+            continue
+        try:
+            session = {k: float(session[k]) for k in ('inhale', 'hold', 'exhale')}
+        except (KeyError, TypeError, ValueError):
+            continue
+        h, e, d, category = classify(session)
+        partial['sessions'] += 1
+        partial['categories'][category] += 1
+        value = session['hold']
+        hold['count'] += 1
+        hold['sum'] += value
+        hold['min'] = value if hold['min'] is None else min(hold['min'], value)
+        hold['max'] = value if hold['max'] is None else max(hold['max'], value)
+        hold['bins'][bin_of(value, HOLD_BIN, HOLD_BINS)] += 1
+        if d is not None:
+            partial['ratio_h'][bin_of(h, RATIO_BIN, RATIO_BINS)] += 1
+            partial['ratio_e'][bin_of(e, RATIO_BIN, RATIO_BINS)] += 1
+            partial['deviation_sum'] += d
+    return partial
+
+def merge(total, partial):
+    total['patients'] += partial['patients']
+    total['sessions'] += partial['sessions']
+    for name in CATEGORIES:
+        total['categories'][name] += partial['categories'][name]
+    a, b = total['hold'], partial['hold']
+    a['count'] += b['count']
+    a['sum'] += b['sum']
+    for key, pick in (('min', min), ('max', max)):
+        if b[key] is not None:
+            a[key] = b[key] if a[key] is None else pick(a[key], b[key])
+    a['bins'] = [x + y for x, y in zip(a['bins'], b['bins'])]
+    total['ratio_h'] = [x + y for x, y in zip(total['ratio_h'], partial['ratio_h'])]
+    total['ratio_e'] = [x + y for x, y in zip(total['ratio_e'], partial['ratio_e'])]
+    total['deviation_sum'] += partial['deviation_sum']
+    total['errors'].extend(partial['errors'])
+    return total
+
+def percentile(bins, width, q):
+    count = sum(bins)
+    if not count:
+        return None
+    rank = q / 100 * count
+    seen = 0
+    for i, n in enumerate(bins):
+        if n and seen + n >= rank:
+            # Interpolate inside the bin that holds the rank
+            return round((i + (rank - seen) / n) * width, 2)
+        seen += n
+    return len(bins) * width
+
+def histogram(bins, width):
+    return [{'from': i * width, 'to': (i + 1) * width, 'count': n} for i, n in enumerate(bins) if n]
+
+def build_report(total, shards):
+    hold = total['hold']
+    scored = sum(total['ratio_h'])
+    return {
+        'generated': datetime.now().isoformat(),
+        'shards': shards,
+        'patients': total['patients'],
+        'sessions': total['sessions'],
+        'categories': total['categories'],
+        'hold': {
+            'count': hold['count'],
+            'mean': hold['sum'] / hold['count'] if hold['count'] else 0,
+            'min': hold['min'],
+            'max': hold['max'],
+            'percentiles': {f'p{q}': percentile(hold['bins'], HOLD_BIN, q) for q in PERCENTILES}
+        },
+        'ratio_h': histogram(total['ratio_h'], RATIO_BIN),
+        'ratio_e': histogram(total['ratio_e'], RATIO_BIN),
+        'avg_deviation': total['deviation_sum'] / scored if scored else 0,
+        'errors': total['errors']
+    }
+
+def find_shards(paths):
+    shards = []
+    for path in paths:
+        if os.path.isdir(path):
+            shards.extend(sorted(glob.glob(os.path.join(path, '*.json'))))
+        else:
+            shards.append(path)
+    return shards
+
+def run(paths, workers=None, output=REPORT_FILE):
+    shards = find_shards(paths)
+    total = empty_partial()
+    # Spawned, not forked: the API runs this from a multi-threaded process
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        for partial in pool.map(aggregate_shard, shards, chunksize=max(1, len(shards) // 64)):
+            merge(total, partial)
+    report = build_report(total, len(shards))
+    tmp = output + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp, output)
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the cohort analytics report from patient data files')
+    parser.add_argument('paths', nargs='*', default=['breath_data.json'],
+                        help='patient data files or directories of them')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', default=REPORT_FILE)
+    args = parser.parse_args()
+    report = run(args.paths, args.workers, args.output)
+    print(f"Cohort report: {report['patients']} patients, {report['sessions']} sessions -> {args.output}")
@@ -0,0 +1,125 @@
+import argparse
+import functools
+import os
+import signal
+import sys
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    BaseApplication = None
+
+try:
+    import waitress
+except ImportError:
+    waitress = None
+
+# Production entry point. app.py is imported once in this process, so storage,
+# indexes and trends are loaded before gunicorn forks its workers and shared
+# copy-on-write; the background threads (writer, archiver, jobs, ...) are
+# started in each worker after the fork. On SIGTERM gunicorn stops accepting,
+# lets in-flight requests finish within the graceful timeout, and each worker
+# then flushes its queued writes before exiting. Where gunicorn is unavailable
+# (Windows) the app runs threaded in a single waitress process instead.
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run the breath API under a production WSGI server')
+    parser.add_argument('--host', default=os.environ.get('BREATH_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('BREATH_PORT', '5000')))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('BREATH_WORKERS', '1')),
+                        help='worker processes; more than one turns on BREATH_SHARED_STORE')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('BREATH_THREADS', '8')),
+                        help='request threads per worker')
+    parser.add_argument('--keep-alive', type=int, default=int(os.environ.get('BREATH_KEEP_ALIVE', '5')),
+                        help='seconds an idle keep-alive connection is held open')
+    # No default here, so waitress can tell whether it was asked for
+    parser.add_argument('--timeout', type=int, default=os.environ.get('BREATH_TIMEOUT'),
+                        help='seconds a gunicorn worker may stall before it is restarted (default 30)')
+    parser.add_argument('--graceful-timeout', type=int, default=int(os.environ.get('BREATH_GRACEFUL_TIMEOUT', '30')),
+                        help='seconds in-flight requests get to finish after SIGTERM')
+    parser.add_argument('--server', choices=['gunicorn', 'waitress'],
+                        default='gunicorn' if BaseApplication is not None else 'waitress')
+    return parser.parse_args()
+
+def load_app(args):
+    # Both must be set before app.py is imported
+    os.environ['BREATH_PREFORK'] = '1'
+    if args.workers > 1 and os.environ.get('BREATH_MONGO_URI'):
+        sys.exit('BREATH_MONGO_URI supports a single worker; use --workers 1 with more --threads')
+    if args.workers > 1:
+        os.environ['BREATH_SHARED_STORE'] = '1'
+    import app as breath
+    return breath
+
+def post_fork(server, worker):
+    sys.modules['app'].start_background()
+
+def worker_exit(server, worker):
+    # Also called in the master for a worker that is already gone; only the
+    # worker itself has a writer thread to flush
+    if worker.pid == os.getpid():
+        sys.modules['app'].drain_writes()
+
+if BaseApplication is not None:
+    class GunicornServer(BaseApplication):
+        def __init__(self, application, options):
+            self.application = application
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+def serve_gunicorn(breath, args):
+    GunicornServer(breath.app, {
+        'bind': f'{args.host}:{args.port}',
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',
+        'keepalive': args.keep_alive,
+        'timeout': args.timeout if args.timeout is not None else 30,
+        'graceful_timeout': args.graceful_timeout,
+        'preload_app': True,
+        'post_fork': post_fork,
+        'worker_exit': worker_exit
+    }).run()
+
+def serve_waitress(breath, args):
+    if args.workers > 1:
+        print('waitress runs a single process; ignoring --workers')
+    if args.timeout is not None:
+        print('waitress does not restart stalled workers; ignoring --timeout')
+    breath.start_background()
+    server = waitress.create_server(breath.app, host=args.host, port=args.port, threads=args.threads,
+                                    channel_timeout=args.keep_alive, cleanup_interval=args.keep_alive)
+    # run() waits for running requests when SystemExit/KeyboardInterrupt ends
+    # the loop, but only for a fixed 5 seconds unless told otherwise
+    server.task_dispatcher.shutdown = functools.partial(server.task_dispatcher.shutdown,
+                                                        timeout=args.graceful_timeout)
+
+    def stop(signum, frame):
+        raise SystemExit
+
+    signal.signal(signal.SIGTERM, stop)
+    print(f'Serving on http://{args.host}:{args.port}')
+    server.run()
+    breath.drain_writes()
+
+def main():
+    args = parse_args()
+    if args.server == 'gunicorn' and BaseApplication is None:
+        sys.exit('gunicorn is not installed (pip install gunicorn)')
+    if args.server == 'waitress' and waitress is None:
+        sys.exit('waitress is not installed (pip install waitress)')
+    breath = load_app(args)
+    if args.server == 'gunicorn':
+        serve_gunicorn(breath, args)
+    else:
+        serve_waitress(breath, args)
+
+if __name__ == '__main__':
+    main()
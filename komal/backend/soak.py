@@ -0,0 +1,361 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from multiprocessing import Pool
+
+# Soak and consistency run for the storage layer. Worker threads (optionally in
+# several processes against a running server) issue randomized interleaved
+# writes, deletes, reads and clears while tracking what each acknowledged
+# write should have left behind; afterwards the API, the stats and the
+# persisted file are checked against that model.
+TIMING_TYPES = ['Inhalation', 'Breath-Hold', 'Exhalation']
+OPERATIONS = [
+    ('post_timing', 30),
+    ('post_session', 10),
+    ('delete_timing', 10),
+    ('replay', 5),
+    ('get_timings', 15),
+    ('get_sessions', 10),
+    ('get_stats', 10),
+    ('get_changes', 10)
+]
+
+class HttpClient:
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+
+    def request(self, method, path, body=None, headers=None):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.url + path, data=data, method=method,
+                                     headers=dict(headers or {}, **{'Content-Type': 'application/json'}))
+        try:
+            with urllib.request.urlopen(req, timeout=30) as response:
+                return response.status, json.loads(response.read() or b'null')
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read() or b'null')
+
+class LocalClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None, headers=None):
+        response = self.client.open(path, method=method, json=body, headers=headers or {})
+        return response.status_code, response.get_json(silent=True)
+
+class ClearBarrier:
+    # Clears take the store exclusively so the model never races a clear
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.active = 0
+        self.clearing = False
+
+    def enter(self):
+        with self.cond:
+            while self.clearing:
+                self.cond.wait()
+            self.active += 1
+
+    def leave(self):
+        with self.cond:
+            self.active -= 1
+            self.cond.notify_all()
+
+    def clear(self, apply):
+        with self.cond:
+            while self.clearing:
+                self.cond.wait()
+            self.clearing = True
+            while self.active:
+                self.cond.wait()
+        try:
+            apply()
+        finally:
+            with self.cond:
+                self.clearing = False
+                self.cond.notify_all()
+
+class Soak:
+    def __init__(self, client, seconds, threads, clear_every, seed):
+        self.client = client
+        self.seconds = seconds
+        self.threads = threads
+        self.clear_every = clear_every
+        self.random = random.Random(seed)
+        self.barrier = ClearBarrier()
+        self.lock = threading.RLock()
+        # Model of acknowledged state: id -> record as sent
+        self.timings = {}
+        self.sessions = {}
+        self.replays = []
+        # Keys whose record was deleted; replaying one may create a new record
+        self.retired = set()
+        self.issued = {'timings': set(), 'sessions': set()}
+        self.latencies = {}
+        self.counts = {}
+        self.failures = []
+
+    def call(self, name, method, path, body=None, headers=None):
+        started = time.perf_counter()
+        status, data = self.client.request(method, path, body, headers)
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.latencies.setdefault(name, []).append(elapsed)
+            self.counts.setdefault(name, {})
+            self.counts[name][status] = self.counts[name].get(status, 0) + 1
+        if status in (429, 503):
+            time.sleep(0.05)
+        return status, data
+
+    def fail(self, message):
+        with self.lock:
+            if len(self.failures) < 50:
+                self.failures.append(message)
+
+    def created(self, kind, new_id, record):
+        with self.lock:
+            if new_id in self.issued[kind]:
+                self.fail(f'{kind} id {new_id} issued twice')
+            self.issued[kind].add(new_id)
+            (self.timings if kind == 'timings' else self.sessions)[new_id] = record
+
+    def post_timing(self, rng):
+        record = {'type': rng.choice(TIMING_TYPES), 'duration': round(rng.uniform(0.5, 30), 3)}
+        key = uuid.uuid4().hex
+        status, data = self.call('post_timing', 'POST', '/api/timings', record, {'Idempotency-Key': key})
+        if status == 200:
+            self.created('timings', data['id'], record)
+            with self.lock:
+                self.replays.append(('/api/timings', key, record, data['id']))
+                del self.replays[:-1000]
+
+    def post_session(self, rng):
+        record = {k: round(rng.uniform(1, 20), 3) for k in ('inhale', 'hold', 'exhale')}
+        status, data = self.call('post_session', 'POST', '/api/sessions', record)
+        if status == 200:
+            self.created('sessions', data['id'], record)
+
+    def delete_timing(self, rng):
+        with self.lock:
+            if not self.timings:
+                return
+            timing_id = rng.choice(list(self.timings))
+            record = self.timings.pop(timing_id)
+            self.retired.update(r[1] for r in self.replays if r[3] == timing_id)
+            self.replays = [r for r in self.replays if r[3] != timing_id]
+        status, _ = self.call('delete_timing', 'DELETE', f'/api/timings/{timing_id}')
+        if status != 200:
+            with self.lock:
+                self.timings[timing_id] = record
+
+    def replay(self, rng):
+        with self.lock:
+            if not self.replays:
+                return
+            path, key, record, expected = rng.choice(self.replays)
+        status, data = self.call('replay', 'POST', path, record, {'Idempotency-Key': key})
+        if status != 200 or data['id'] == expected:
+            return
+        with self.lock:
+            retired = key in self.retired
+        if retired:
+            # Raced the delete of its record: the server forgot the key and created anew
+            self.created('timings', data['id'], record)
+        else:
+            self.fail(f'replay of {key} returned {data["id"]}, expected {expected}')
+
+    def get_timings(self, rng):
+        self.call('get_timings', 'GET', f'/api/timings?limit={rng.randint(1, 100)}')
+
+    def get_sessions(self, rng):
+        self.call('get_sessions', 'GET', f'/api/sessions?limit={rng.randint(1, 100)}')
+
+    def get_stats(self, rng):
+        self.call('get_stats', 'GET', '/api/stats')
+
+    def get_changes(self, rng):
+        self.call('get_changes', 'GET', f'/api/changes?since={rng.randint(0, 50)}')
+
+    def clear(self):
+        status, _ = self.call('clear', 'DELETE', '/api/clear')
+        if status == 200:
+            with self.lock:
+                self.timings.clear()
+                self.sessions.clear()
+                self.replays.clear()
+                self.retired.clear()
+
+    def worker(self, seed, deadline):
+        rng = random.Random(seed)
+        names = [name for name, _ in OPERATIONS]
+        weights = [weight for _, weight in OPERATIONS]
+        while time.time() < deadline:
+            name = rng.choices(names, weights)[0]
+            self.barrier.enter()
+            try:
+                getattr(self, name)(rng)
+            except Exception as e:
+                self.fail(f'{name}: {e!r}')
+            finally:
+                self.barrier.leave()
+
+    def clearer(self, deadline):
+        while time.time() + self.clear_every < deadline:
+            time.sleep(self.clear_every)
+            self.barrier.clear(self.clear)
+
+    def run(self):
+        deadline = time.time() + self.seconds
+        threads = [threading.Thread(target=self.worker, args=(self.random.random(), deadline))
+                   for _ in range(self.threads)]
+        if self.clear_every:
+            threads.append(threading.Thread(target=self.clearer, args=(deadline,)))
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return time.perf_counter() - started
+
+def check_state(client, timings, sessions):
+    failures = []
+    status, listed = client.request('GET', '/api/timings')
+    ids = [t['_id'] for t in listed]
+    if len(ids) != len(set(ids)):
+        failures.append('duplicate timing ids in GET /api/timings')
+    for name, expected, actual in (('timings', set(timings), set(ids)),
+                                   ('sessions', set(sessions), {s['_id'] for s in client.request('GET', '/api/sessions')[1]})):
+        if expected - actual:
+            failures.append(f'lost {name}: {sorted(expected - actual)[:10]}')
+        if actual - expected:
+            failures.append(f'unexpected {name}: {sorted(actual - expected)[:10]}')
+    for t in listed:
+        sent = timings.get(t['_id'])
+        if sent and (sent['type'] != t['type'] or abs(sent['duration'] - t['duration']) > 1e-9):
+            failures.append(f'timing {t["_id"]} stored as {t["type"]}/{t["duration"]}, sent {sent}')
+    # Stats must agree with the raw records
+    _, stats = client.request('GET', '/api/stats')
+    if stats['total_timings'] != len(listed) or stats['total_sessions'] != len(sessions):
+        failures.append(f'stats totals {stats["total_timings"]}/{stats["total_sessions"]} '
+                        f'!= {len(listed)}/{len(sessions)}')
+    for name, key in (('Inhalation', 'avg_inhale'), ('Breath-Hold', 'avg_hold'), ('Exhalation', 'avg_exhale')):
+        durations = [t['duration'] for t in listed if t['type'] == name]
+        expected = sum(durations) / len(durations) if durations else 0
+        if abs(stats[key] - expected) > 1e-6:
+            failures.append(f'stats {key} {stats[key]} != {expected}')
+    return failures
+
+def check_persisted(app):
+    # Everything acknowledged has been saved, so a reload must match memory exactly
+    with app.storage_lock:
+        in_memory = json.loads(json.dumps(app.storage))
+    reloaded = app.drop_archived(app.load_data())
+    # A document store returns records in timestamp order, memory keeps arrival order
+    for data in (in_memory, reloaded):
+        for kind in ('timings', 'sessions'):
+            data[kind].sort(key=lambda r: r['_id'])
+    if reloaded != in_memory:
+        differing = [k for k in set(in_memory) | set(reloaded) if in_memory.get(k) != reloaded.get(k)]
+        return [f'persisted file differs from memory in {sorted(differing)}']
+    return []
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))] if values else 0
+
+def report(soak, elapsed):
+    total = sum(len(v) for v in soak.latencies.values())
+    rows = {}
+    for name, values in sorted(soak.latencies.items()):
+        rows[name] = {
+            'count': len(values),
+            'status': soak.counts[name],
+            'p50_ms': round(percentile(values, 50) * 1000, 2),
+            'p95_ms': round(percentile(values, 95) * 1000, 2),
+            'p99_ms': round(percentile(values, 99) * 1000, 2),
+            'max_ms': round(max(values) * 1000, 2)
+        }
+    return {'seconds': round(elapsed, 2), 'operations': total,
+            'ops_per_second': round(total / elapsed, 1) if elapsed else 0, 'by_operation': rows}
+
+def remote_worker(args):
+    url, seconds, threads, seed = args
+    soak = Soak(HttpClient(url), seconds, threads, 0, seed)
+    elapsed = soak.run()
+    return soak.timings, soak.sessions, soak.failures, report(soak, elapsed)
+
+def print_report(result, failures):
+    print(json.dumps(result, indent=2))
+    if failures:
+        print(f'FAILED: {len(failures)} invariant violations')
+        for failure in failures:
+            print(' -', failure)
+    else:
+        print('OK: no lost or duplicated ids, stats match, state consistent')
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent soak and consistency run for the breath API')
+    parser.add_argument('--seconds', type=float, default=60)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--clear-every', type=float, default=15,
+                        help='seconds between exclusive clears (0 disables; single process only)')
+    parser.add_argument('--url', help='run against a live server instead of an in-process app')
+    parser.add_argument('--processes', type=int, default=1, help='client processes when --url is given')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--output', help='also write the report as JSON to this file')
+    args = parser.parse_args()
+    seed = args.seed if args.seed is not None else random.randrange(1 << 30)
+    print(f'Soak seed {seed}')
+
+    if args.url and args.processes > 1:
+        # Each process only deletes its own records, so the models merge by union
+        client = HttpClient(args.url)
+        client.request('DELETE', '/api/clear')
+        with Pool(args.processes) as pool:
+            parts = pool.map(remote_worker, [(args.url, args.seconds, args.threads, seed + i)
+                                              for i in range(args.processes)])
+        timings, sessions, failures = {}, {}, []
+        for part_timings, part_sessions, part_failures, _ in parts:
+            overlap = set(timings) & set(part_timings)
+            if overlap:
+                failures.append(f'timing ids issued to two processes: {sorted(overlap)[:10]}')
+            timings.update(part_timings)
+            sessions.update(part_sessions)
+            failures.extend(part_failures)
+        failures += check_state(client, timings, sessions)
+        result = {'processes': [part[3] for part in parts]}
+    else:
+        if args.url:
+            client = HttpClient(args.url)
+            app = None
+        else:
+            # A scratch directory keeps the run away from the real data file
+            os.chdir(tempfile.mkdtemp(prefix='breath-soak-'))
+            os.environ.setdefault('BREATH_WRITE_BURST', '1000000')
+            os.environ.setdefault('BREATH_WRITE_RATE', '1000000')
+            sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+            import app
+            client = LocalClient(app.app)
+        client.request('DELETE', '/api/clear')
+        soak = Soak(client, args.seconds, args.threads, args.clear_every, seed)
+        elapsed = soak.run()
+        failures = soak.failures + check_state(client, soak.timings, soak.sessions)
+        if app is not None:
+            failures += check_persisted(app)
+        result = report(soak, elapsed)
+
+    print_report(result, failures)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(dict(result, failures=failures), f, indent=2)
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
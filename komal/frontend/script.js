@@ -1,39 +1,66 @@
 const API_BASE = 'http://localhost:5000/api';
 
-let timerInterval = null;
 let elapsedTime = 0;
+let startedAt = 0;
+let frameId = 0;
 let isRunning = false;
 let currentTimingType = '';
 
+// Elapsed time is derived from performance.now() timestamps rather than
+// counted ticks, so throttled or busy tabs never lose time. The display is
+// painted once per animation frame, and not at all while the tab is hidden.
+function currentElapsed() {
+  return isRunning ? elapsedTime + (performance.now() - startedAt) : elapsedTime;
+}
+
 function startTimer() {
   if (isRunning) return;
   isRunning = true;
-  timerInterval = setInterval(() => {
-    elapsedTime += 10;
-    updateDisplay();
-  }, 10);
+  startedAt = performance.now();
+  scheduleFrame();
+}
+
+function scheduleFrame() {
+  if (!frameId && isRunning && !document.hidden) frameId = requestAnimationFrame(paintFrame);
+}
+
+function paintFrame() {
+  frameId = 0;
+  updateDisplay();
+  scheduleFrame();
+}
+
+function stopFrames() {
+  cancelAnimationFrame(frameId);
+  frameId = 0;
 }
 
 function pauseTimer() {
+  if (!isRunning) return;
+  elapsedTime = currentElapsed();
   isRunning = false;
-  clearInterval(timerInterval);
+  stopFrames();
+  updateDisplay();
 }
 
 function resetTimer() {
   isRunning = false;
-  clearInterval(timerInterval);
+  stopFrames();
   elapsedTime = 0;
   updateDisplay();
 }
 
 function updateDisplay() {
-  const minutes = Math.floor(elapsedTime / 60000);
-  const seconds = Math.floor((elapsedTime % 60000) / 1000);
-  const ms = Math.floor((elapsedTime % 1000) / 10);
-  document.getElementById('display').textContent =
+  const elapsed = currentElapsed();
+  const minutes = Math.floor(elapsed / 60000);
+  const seconds = Math.floor((elapsed % 60000) / 1000);
+  const ms = Math.floor((elapsed % 1000) / 10);
+  const text =
     String(minutes).padStart(2,'0') + ':' +
     String(seconds).padStart(2,'0') + '.' +
     String(ms).padStart(2,'0');
+  const display = document.getElementById('display');
+  if (display.textContent !== text) display.textContent = text;
 }
 
 function updateTimingType() {
@@ -45,69 +72,372 @@ function updateTimingType() {
   }
 }
 
-async function saveCurrentTiming() {
-  if (!currentTimingType) {
-    alert('Please select a timing type first.');
+// Offline-first writes: every change goes into a persistent IndexedDB outbox
+// first and is shown immediately, then synced to /api/batch in the
+// background, oldest first, with exponential backoff while the server is
+// unreachable or busy. Each change carries its own key so resends are harmless.
+const OUTBOX_DB = 'breath-outbox';
+const SYNC_BATCH_SIZE = 100;
+const SYNC_DELAY = 500;
+const MAX_BACKOFF = 60000;
+
+let outboxDb = null;
+let memoryOutbox = [];
+let memorySeq = 0;
+let syncTimer = null;
+let syncBackoff = 1000;
+let syncing = false;
+let syncAgain = false;
+
+function openOutbox() {
+  if (outboxDb) return Promise.resolve(outboxDb);
+  return new Promise(resolve => {
+    // Without IndexedDB (e.g. some private modes) the outbox lives in memory
+    if (!window.indexedDB) return resolve(null);
+    const request = indexedDB.open(OUTBOX_DB, 1);
+    request.onupgradeneeded = () => {
+      request.result.createObjectStore('ops', { keyPath: 'seq', autoIncrement: true });
+    };
+    request.onsuccess = () => {
+      outboxDb = request.result;
+      resolve(outboxDb);
+    };
+    request.onerror = () => resolve(null);
+  });
+}
+
+function outboxTransaction(mode, work) {
+  return openOutbox().then(db => new Promise((resolve, reject) => {
+    const tx = db.transaction('ops', mode);
+    const result = work(tx.objectStore('ops'));
+    tx.oncomplete = () => resolve(result && result.result);
+    tx.onerror = () => reject(tx.error);
+  }));
+}
+
+async function outboxAdd(op) {
+  if (!(await openOutbox())) {
+    memoryOutbox.push(Object.assign({ seq: ++memorySeq }, op));
     return;
   }
-  const seconds = (elapsedTime / 1000).toFixed(2);
-  
+  await outboxTransaction('readwrite', store => store.add(op));
+}
+
+async function outboxAll() {
+  if (!(await openOutbox())) return memoryOutbox.slice();
+  return outboxTransaction('readonly', store => store.getAll());
+}
+
+async function outboxDelete(seqs) {
+  if (!(await openOutbox())) {
+    memoryOutbox = memoryOutbox.filter(op => !seqs.includes(op.seq));
+    return;
+  }
+  await outboxTransaction('readwrite', store => seqs.forEach(seq => store.delete(seq)));
+}
+
+function newChangeKey() {
+  if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+  return Date.now() + '-' + Math.random().toString(36).slice(2);
+}
+
+async function queueChange(op, data) {
+  const change = { key: newChangeKey(), op: op, data: data, recorded: Date.now() };
+  await outboxAdd(change);
+  scheduleSync();
+  return change;
+}
+
+function scheduleSync(delay) {
+  clearTimeout(syncTimer);
+  syncTimer = setTimeout(syncOutbox, delay === undefined ? SYNC_DELAY : delay);
+}
+
+async function syncOutbox() {
+  if (syncing) {
+    syncAgain = true;
+    return;
+  }
+  syncing = true;
+  let retryAfter = 0;
   try {
-    const response = await fetch(`${API_BASE}/timings`, {
+    const ops = (await outboxAll()).slice(0, SYNC_BATCH_SIZE);
+    if (!ops.length) return;
+    const response = await fetch(`${API_BASE}/batch`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify({
-        type: currentTimingType,
-        duration: seconds
+        operations: ops.map(op => ({
+          op: op.op, key: op.key, data: op.data, age_ms: Date.now() - op.recorded
+        }))
       })
     });
-    
-    if (response.ok) {
-      alert('Saved: ' + currentTimingType + ' = ' + seconds + 's');
-      elapsedTime = 0;
-      updateDisplay();
-      loadPastData();
-      loadStats();
+    if (!response.ok) {
+      retryAfter = (parseInt(response.headers.get('Retry-After'), 10) || 0) * 1000;
+      throw new Error('Sync rejected with status ' + response.status);
     }
+    const results = (await response.json()).results;
+    // Every change got a definitive answer; only server errors are kept for retry
+    const failed = new Set(results.filter(r => r.status >= 500).map(r => r.key));
+    await outboxDelete(ops.filter(op => !failed.has(op.key)).map(op => op.seq));
+    syncBackoff = 1000;
+    onChangesSynced(ops, results);
+    if (failed.size) throw new Error('Some changes failed to apply');
+    if (ops.length === SYNC_BATCH_SIZE) syncAgain = true;
   } catch (error) {
-    alert('Error saving timing. Check if backend is running.');
+    console.error('Sync failed, will retry:', error);
+    scheduleSync(Math.max(retryAfter, syncBackoff * (0.5 + Math.random())));
+    syncBackoff = Math.min(syncBackoff * 2, MAX_BACKOFF);
+    syncAgain = false;
+  } finally {
+    syncing = false;
+    if (syncAgain) {
+      syncAgain = false;
+      scheduleSync(0);
+    }
   }
 }
 
-async function loadPastData() {
+function onChangesSynced(ops, results) {
+  const synced = new Set(ops.map(op => op.key));
+  timingSource.pending = timingSource.pending.filter(r => !synced.has(r.key));
+  timingSource.views.forEach(renderWindow);
+  pullChanges();
+  if (results.some(r => r.op === 'assemble' && r.status === 400)) {
+    alert('Need at least one Inhalation, Breath-Hold, and Exhalation timing to save a session.');
+  }
+}
+
+function localDateTime(d) {
+  const pad = n => String(n).padStart(2, '0');
+  return `${d.getFullYear()}-${pad(d.getMonth() + 1)}-${pad(d.getDate())} ` +
+    `${pad(d.getHours())}:${pad(d.getMinutes())}:${pad(d.getSeconds())}`;
+}
+
+function pendingTimingRow(change) {
+  return {
+    _id: 'pending-' + change.key,
+    key: change.key,
+    pending: true,
+    type: change.data.type,
+    duration: change.data.duration,
+    date: localDateTime(new Date(change.recorded))
+  };
+}
+
+async function showPendingTimings() {
+  const ops = await outboxAll();
+  timingSource.pending = ops.filter(op => op.op === 'timing').map(pendingTimingRow).reverse();
+  timingSource.views.forEach(renderWindow);
+  scheduleSync(0);
+}
+
+async function saveCurrentTiming() {
+  if (!currentTimingType) {
+    alert('Please select a timing type first.');
+    return;
+  }
+  const seconds = (currentElapsed() / 1000).toFixed(2);
+  
   try {
-    const response = await fetch(`${API_BASE}/timings`);
-    const records = await response.json();
-    
-    const tbody1 = document.getElementById('past-data-table');
-    const tbody2 = document.getElementById('past-data-table-2');
-
-    if (records.length === 0) {
-      const row = '<tr><td colspan="4">No records yet.</td></tr>';
-      tbody1.innerHTML = row;
-      tbody2.innerHTML = row;
-      return;
-    }
+    const change = await queueChange('timing', { type: currentTimingType, duration: seconds });
+    timingSource.pending.unshift(pendingTimingRow(change));
+    timingSource.views.forEach(renderWindow);
+    alert('Saved: ' + currentTimingType + ' = ' + seconds + 's');
+    elapsedTime = 0;
+    if (isRunning) startedAt = performance.now();
+    updateDisplay();
+  } catch (error) {
+    alert('Error saving timing.');
+  }
+}
+
+// Long tables are virtualized: each tbody holds only the rows in view plus
+// spacer rows standing in for the rest, and older records are fetched a page
+// at a time (keyset on timestamp) as the user scrolls towards them.
+const PAGE_SIZE = 50;
+const VIEWPORT_HEIGHT = 480;
+const OVERSCAN = 10;
+
+function createPagedSource(url) {
+  return { url: url, rows: [], pending: [], exhausted: false, loading: null, generation: 0, views: [] };
+}
 
-    const rows = records.map(r => `
-      <tr>
-        <td>${r.date}</td>
-        <td>${r.type}</td>
-        <td>${r.duration}</td>
-        <td><button class="delete-btn" onclick="deleteRecord('${r._id}')">Delete</button></td>
-      </tr>
-    `).join('');
-    tbody1.innerHTML = rows;
-    tbody2.innerHTML = rows;
+const timingSource = createPagedSource(`${API_BASE}/timings`);
+const sessionSource = createPagedSource(`${API_BASE}/sessions`);
+
+function fetchNextPage(source) {
+  if (source.exhausted) return Promise.resolve();
+  if (source.loading) return source.loading;
+  const generation = source.generation;
+  const last = source.rows[source.rows.length - 1];
+  const cursor = last ? `&before=${encodeURIComponent(last.timestamp)}` : '';
+  source.loading = fetch(`${source.url}?limit=${PAGE_SIZE}${cursor}`)
+    .then(r => r.json())
+    .then(page => {
+      if (generation !== source.generation) return;
+      source.loading = null;
+      source.rows.push(...page);
+      if (page.length < PAGE_SIZE) source.exhausted = true;
+      source.views.forEach(renderWindow);
+    })
+    .catch(error => {
+      source.loading = null;
+      console.error('Error loading records:', error);
+    });
+  return source.loading;
+}
+
+function resetSource(source, rows, complete) {
+  source.rows = rows.slice();
+  source.exhausted = !!complete;
+  source.loading = null;
+  source.generation++;
+  source.views.forEach(view => {
+    view.viewport.scrollTop = 0;
+    renderWindow(view);
+  });
+}
+
+let changeSeq = null;
+
+async function pullChanges() {
+  // Applies only what changed since the last dashboard load or pull
+  if (changeSeq === null) return loadDashboard();
+  try {
+    const response = await fetch(`${API_BASE}/changes?since=${changeSeq}`);
+    const feed = await response.json();
+    if (feed.resync) return loadDashboard();
+    feed.changes.forEach(applyChange);
+    changeSeq = feed.seq;
+    if (feed.changes.length) {
+      timingSource.views.forEach(renderWindow);
+      sessionSource.views.forEach(renderWindow);
+      loadStats();
+    }
+    if (feed.more) return pullChanges();
   } catch (error) {
-    console.error('Error loading data:', error);
+    console.error('Error pulling changes:', error);
   }
 }
 
+function applyChange(change) {
+  if (change.op === 'insert') {
+    insertRow(change.collection === 'timings' ? timingSource : sessionSource, change.record);
+  } else if (change.op === 'delete') {
+    const source = change.collection === 'sessions' ? sessionSource : timingSource;
+    const gone = new Set(change.ids || [change.id]);
+    source.rows = source.rows.filter(r => !gone.has(r._id));
+  } else if (change.op === 'profile') {
+    renderProfile(change.record);
+  } else if (change.op === 'clear') {
+    resetSource(timingSource, [], true);
+    resetSource(sessionSource, [], true);
+    renderProfile({});
+  }
+}
+
+function insertRow(source, record) {
+  if (source.rows.some(r => r._id === record._id)) return;
+  const oldest = source.rows[source.rows.length - 1];
+  // Older than every loaded row: it arrives with the page that covers it
+  if (oldest && record.timestamp < oldest.timestamp && !source.exhausted) return;
+  let i = 0;
+  while (i < source.rows.length && source.rows[i].timestamp > record.timestamp) i++;
+  source.rows.splice(i, 0, record);
+}
+
+function removeRow(source, id) {
+  source.rows = source.rows.filter(r => r._id !== id);
+  source.views.forEach(renderWindow);
+}
+
+function attachView(source, tbodyId, colspan, emptyText, renderRow) {
+  const tbody = document.getElementById(tbodyId);
+  const table = tbody.closest('table');
+  const viewport = document.createElement('div');
+  viewport.style.maxHeight = VIEWPORT_HEIGHT + 'px';
+  viewport.style.overflowY = 'auto';
+  table.parentNode.insertBefore(viewport, table);
+  viewport.appendChild(table);
+
+  const view = { source, tbody, viewport, colspan, emptyText, renderRow, rowHeight: 0, frame: 0 };
+  viewport.addEventListener('scroll', () => scheduleRender(view));
+  source.views.push(view);
+  return view;
+}
+
+function scheduleRender(view) {
+  if (view.frame) return;
+  view.frame = requestAnimationFrame(() => {
+    view.frame = 0;
+    renderWindow(view);
+  });
+}
+
+function spacerRow(view, height) {
+  const row = document.createElement('tr');
+  row.style.height = height + 'px';
+  row.innerHTML = `<td colspan="${view.colspan}" style="padding:0;border:0"></td>`;
+  return row;
+}
+
+function renderWindow(view) {
+  const source = view.source;
+  const count = source.pending.length + source.rows.length;
+  if (!count) {
+    view.tbody.innerHTML = `<tr><td colspan="${view.colspan}">${view.emptyText}</td></tr>`;
+    if (!source.exhausted) fetchNextPage(source);
+    return;
+  }
+
+  // Hidden tables measure as zero, so fall back to an estimate until shown
+  const rowHeight = view.rowHeight || 48;
+  const visible = Math.ceil((view.viewport.clientHeight || VIEWPORT_HEIGHT) / rowHeight);
+  const start = Math.max(0, Math.floor(view.viewport.scrollTop / rowHeight) - OVERSCAN);
+  const end = Math.min(count, start + visible + 2 * OVERSCAN);
+
+  // Unsynced local records sit above everything the server has returned
+  const rowAt = i => i < source.pending.length ? source.pending[i] : source.rows[i - source.pending.length];
+  const fragment = document.createDocumentFragment();
+  fragment.appendChild(spacerRow(view, start * rowHeight));
+  for (let i = start; i < end; i++) fragment.appendChild(view.renderRow(rowAt(i), i));
+  fragment.appendChild(spacerRow(view, (count - end) * rowHeight));
+  view.tbody.replaceChildren(fragment);
+
+  if (!view.rowHeight && end > start) view.rowHeight = view.tbody.children[1].offsetHeight;
+  if (end + OVERSCAN >= count) fetchNextPage(source);
+}
+
+function timingRow(r) {
+  const row = document.createElement('tr');
+  row.innerHTML = `
+    <td>${r.date}</td>
+    <td>${r.type}</td>
+    <td>${r.duration}</td>
+    <td><button class="delete-btn" onclick="deleteRecord('${r._id}')">Delete</button></td>
+  `;
+  return row;
+}
+
+async function loadPastData() {
+  resetSource(timingSource, []);
+  await fetchNextPage(timingSource);
+}
+
 async function deleteRecord(id) {
   try {
+    if (id.startsWith('pending-')) {
+      // Not synced yet, so it only has to be dropped from the outbox
+      const key = id.slice('pending-'.length);
+      const ops = await outboxAll();
+      await outboxDelete(ops.filter(op => op.key === key).map(op => op.seq));
+      timingSource.pending = timingSource.pending.filter(r => r._id !== id);
+      timingSource.views.forEach(renderWindow);
+      return;
+    }
     await fetch(`${API_BASE}/timings/${id}`, { method: 'DELETE' });
-    loadPastData();
+    removeRow(timingSource, id);
     loadStats();
   } catch (error) {
     alert('Error deleting record');
@@ -116,127 +446,79 @@ async function deleteRecord(id) {
 
 async function loadStats() {
   try {
-    const response = await fetch(`${API_BASE}/timings`);
-    const records = await response.json();
-    
-    document.getElementById('total-sessions').textContent = records.length;
-
-    const inh = records.filter(r => r.type === 'Inhalation').map(r => parseFloat(r.duration));
-    const hold = records.filter(r => r.type === 'Breath-Hold').map(r => parseFloat(r.duration));
-    const ex = records.filter(r => r.type === 'Exhalation').map(r => parseFloat(r.duration));
-
-    document.getElementById('avg-inhale').textContent =
-      inh.length ? (inh.reduce((a,b)=>a+b,0)/inh.length).toFixed(2)+'s' : '0.0s';
-    document.getElementById('avg-hold').textContent =
-      hold.length ? (hold.reduce((a,b)=>a+b,0)/hold.length).toFixed(2)+'s' : '0.0s';
-    document.getElementById('avg-exhale').textContent =
-      ex.length ? (ex.reduce((a,b)=>a+b,0)/ex.length).toFixed(2)+'s' : '0.0s';
+    const response = await fetch(`${API_BASE}/stats`);
+    renderStats(await response.json());
   } catch (error) {
     console.error('Error loading stats:', error);
   }
 }
 
-async function saveBreathSession() {
-  try {
-    const response = await fetch(`${API_BASE}/timings`);
-    const records = await response.json();
-    
-    if (!records.length) {
-      alert('No timings saved yet. Save inhale, hold, and exhale first.');
-      return;
-    }
-    
-    const lastInh = records.find(r => r.type === 'Inhalation');
-    const lastHold = records.find(r => r.type === 'Breath-Hold');
-    const lastEx = records.find(r => r.type === 'Exhalation');
+function renderStats(stats) {
+  document.getElementById('total-sessions').textContent = stats.total_timings;
 
-    if (!lastInh || !lastHold || !lastEx) {
-      alert('Need at least one Inhalation, Breath-Hold, and Exhalation timing to save a session.');
-      return;
-    }
+  document.getElementById('avg-inhale').textContent =
+    stats.avg_inhale ? stats.avg_inhale.toFixed(2)+'s' : '0.0s';
+  document.getElementById('avg-hold').textContent =
+    stats.avg_hold ? stats.avg_hold.toFixed(2)+'s' : '0.0s';
+  document.getElementById('avg-exhale').textContent =
+    stats.avg_exhale ? stats.avg_exhale.toFixed(2)+'s' : '0.0s';
+}
 
-    await fetch(`${API_BASE}/sessions`, {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({
-        inhale: lastInh.duration,
-        hold: lastHold.duration,
-        exhale: lastEx.duration
-      })
-    });
-    
+async function saveBreathSession() {
+  try {
+    await queueChange('assemble', {});
     alert('Breath session saved. Go to "Breath Timing" and click Process Data.');
-    loadTimingSessions();
   } catch (error) {
     alert('Error saving session');
   }
 }
 
 async function processSessions() {
-  try {
-    const response = await fetch(`${API_BASE}/sessions`);
-    const sessions = await response.json();
-    
-    if (!sessions.length) {
-      alert('No sessions to process. Save a session first.');
-      return;
-    }
-
-    const tbody = document.getElementById('timing-save-table');
-    tbody.innerHTML = '';
-    let idx = 1;
-
-    sessions.forEach(s => {
-      const h = s.hold / s.inhale;
-      const e = s.exhale / s.inhale;
-      const D = Math.sqrt((h - 4)**2 + (e - 2)**2);
-      let category = 'Needs Attention';
-      let chipClass = 'chip-bad';
-      let rowClass = 'highlight-bad';
-
-      if (D <= 1) {
-        category = 'Healthy';
-        chipClass = 'chip-good';
-        rowClass = 'highlight-good';
-      } else if (D <= 2) {
-        category = 'Borderline';
-        chipClass = 'chip-borderline';
-        rowClass = 'highlight-borderline';
-      }
-
-      const row = document.createElement('tr');
-      row.className = rowClass;
-      row.innerHTML = `
-        <td>#${idx++}</td>
-        <td>${s.inhale.toFixed(2)}</td>
-        <td>${s.hold.toFixed(2)}</td>
-        <td>${s.exhale.toFixed(2)}</td>
-        <td>${h.toFixed(2)} : ${e.toFixed(2)}</td>
-        <td>${D.toFixed(2)}</td>
-        <td><span class="chip ${chipClass}">${category}</span></td>
-        <td>${s.date}</td>
-      `;
-      tbody.appendChild(row);
-    });
-  } catch (error) {
-    console.error('Error processing sessions:', error);
+  resetSource(sessionSource, []);
+  await fetchNextPage(sessionSource);
+  if (!sessionSource.rows.length) {
+    alert('No sessions to process. Save a session first.');
   }
 }
 
+function analyseSession(s) {
+  const h = s.hold / s.inhale;
+  const e = s.exhale / s.inhale;
+  const D = Math.sqrt((h - 4)**2 + (e - 2)**2);
+  let category = 'Needs Attention';
+  if (D <= 1) category = 'Healthy';
+  else if (D <= 2) category = 'Borderline';
+  return Object.assign({}, s, { ratio_h: h, ratio_e: e, deviation: D, category: category });
+}
+
+const CATEGORY_STYLES = {
+  'Healthy': ['chip-good', 'highlight-good'],
+  'Borderline': ['chip-borderline', 'highlight-borderline'],
+  'Needs Attention': ['chip-bad', 'highlight-bad']
+};
+
+function sessionRow(session, i) {
+  const s = analyseSession(session);
+  const [chipClass, rowClass] = CATEGORY_STYLES[s.category];
+  const fmt = x => (x === null || x === undefined) ? '-' : x.toFixed(2);
+  const row = document.createElement('tr');
+  row.className = rowClass;
+  row.innerHTML = `
+    <td>#${i + 1}</td>
+    <td>${s.inhale.toFixed(2)}</td>
+    <td>${s.hold.toFixed(2)}</td>
+    <td>${s.exhale.toFixed(2)}</td>
+    <td>${fmt(s.ratio_h)} : ${fmt(s.ratio_e)}</td>
+    <td>${fmt(s.deviation)}</td>
+    <td><span class="chip ${chipClass}">${s.category}</span></td>
+    <td>${s.date}</td>
+  `;
+  return row;
+}
+
 async function loadTimingSessions() {
-  try {
-    const response = await fetch(`${API_BASE}/sessions`);
-    const sessions = await response.json();
-    
-    const tbody = document.getElementById('timing-save-table');
-    if (!sessions.length) {
-      tbody.innerHTML = '<tr><td colspan="8">No complete sessions saved yet.</td></tr>';
-      return;
-    }
-    processSessions();
-  } catch (error) {
-    console.error('Error loading sessions:', error);
-  }
+  resetSource(sessionSource, []);
+  await fetchNextPage(sessionSource);
 }
 
 async function saveProfile() {
@@ -252,11 +534,7 @@ async function saveProfile() {
   };
   
   try {
-    await fetch(`${API_BASE}/profile`, {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify(profile)
-    });
+    await queueChange('profile', profile);
   } catch (error) {
     console.error('Error saving profile:', error);
   }
@@ -265,21 +543,37 @@ async function saveProfile() {
 async function loadProfile() {
   try {
     const response = await fetch(`${API_BASE}/profile`);
-    const profile = await response.json();
-    
-    document.getElementById('fullName').value = profile.fullName || '';
-    document.getElementById('age').value = profile.age || '';
-    document.getElementById('email').value = profile.email || '';
-    document.getElementById('phone').value = profile.phone || '';
-    document.getElementById('height').value = profile.height || '';
-    document.getElementById('weight').value = profile.weight || '';
-    document.getElementById('medical').value = profile.medical || '';
-    document.getElementById('notes').value = profile.notes || '';
+    renderProfile(await response.json());
   } catch (error) {
     console.error('Error loading profile:', error);
   }
 }
 
+function renderProfile(profile) {
+  document.getElementById('fullName').value = profile.fullName || '';
+  document.getElementById('age').value = profile.age || '';
+  document.getElementById('email').value = profile.email || '';
+  document.getElementById('phone').value = profile.phone || '';
+  document.getElementById('height').value = profile.height || '';
+  document.getElementById('weight').value = profile.weight || '';
+  document.getElementById('medical').value = profile.medical || '';
+  document.getElementById('notes').value = profile.notes || '';
+}
+
+async function loadDashboard() {
+  try {
+    const response = await fetch(`${API_BASE}/dashboard?limit=${PAGE_SIZE}`);
+    const dashboard = await response.json();
+    changeSeq = dashboard.seq;
+    resetSource(timingSource, dashboard.timings, dashboard.timings.length < PAGE_SIZE);
+    renderStats(dashboard.stats);
+    resetSource(sessionSource, dashboard.sessions, dashboard.sessions.length < PAGE_SIZE);
+    renderProfile(dashboard.profile);
+  } catch (error) {
+    console.error('Error loading dashboard:', error);
+  }
+}
+
 async function clearAllData() {
   if (confirm('This will delete all saved timings, sessions, and profile. Continue?')) {
     try {
@@ -297,15 +591,29 @@ function showSection(ev, id) {
   document.querySelectorAll('.nav-btn').forEach(b => b.classList.remove('active'));
   ev.target.classList.add('active');
 
-  if (id === 'past-data') loadPastData();
-  if (id === 'timing-save') { loadStats(); loadTimingSessions(); }
+  if (id === 'past-data' || id === 'timing-save') pullChanges();
   if (id === 'profile') loadProfile();
 }
 
 window.addEventListener('DOMContentLoaded', () => {
   updateDisplay();
-  loadPastData();
-  loadStats();
-  loadProfile();
-  loadTimingSessions();
+  attachView(timingSource, 'past-data-table', 4, 'No records yet.', timingRow);
+  attachView(timingSource, 'past-data-table-2', 4, 'No records yet.', timingRow);
+  attachView(sessionSource, 'timing-save-table', 8, 'No complete sessions saved yet.', sessionRow);
+  loadDashboard().then(showPendingTimings);
+});
+
+window.addEventListener('online', () => {
+  scheduleSync(0);
+  pullChanges();
+});
+
+document.addEventListener('visibilitychange', () => {
+  if (document.hidden) {
+    stopFrames();
+  } else {
+    updateDisplay();
+    scheduleFrame();
+    pullChanges();
+  }
 });
\ No newline at end of file